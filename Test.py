@@ -1,4 +1,5 @@
-from google.cloud import bigquery
+from storage import get_backend
 
-client = bigquery.Client()
-print("Connected to project:", client.project)
+backend = get_backend()
+print("Connected to backend:", backend.name)
+print(backend.query("SELECT 1 AS ok"))
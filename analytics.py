@@ -0,0 +1,249 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from metrics import timed
+
+# -----------------------------
+# Config (windows are in bars, i.e. trading days for daily data)
+# -----------------------------
+SENTIMENT_WINDOW = int(os.environ.get("ANALYTICS_SENTIMENT_WINDOW", 7))     # rolling mean of sentiment_score
+CORR_WINDOW = int(os.environ.get("ANALYTICS_CORR_WINDOW", 30))              # rolling sentiment→return correlation
+ZSCORE_WINDOW = int(os.environ.get("ANALYTICS_ZSCORE_WINDOW", 30))          # news-volume baseline
+RETURN_HORIZONS = (1, 5)                                                    # trailing and forward returns
+
+# Rows of history an incremental update needs before the first changed row
+LOOKBACK = max(SENTIMENT_WINDOW, CORR_WINDOW + 1, ZSCORE_WINDOW + 1, max(RETURN_HORIZONS))
+MAX_HORIZON = max(RETURN_HORIZONS)
+
+BASE_COLUMNS = ['symbol', 'ts', 'close', 'sentiment_score', 'news_count']
+OVERLAY_COLUMNS = ['sentiment_roll', 'sentiment_return_corr', 'news_z']   # drawn on the candlestick chart
+
+# -----------------------------
+# Grouped NumPy primitives (rows sorted by symbol, ts)
+# -----------------------------
+# Each row carries the [start, end) bounds of its symbol's run, so shifts and rolling windows
+# for every ticker are computed in one pass over flat arrays, without a per-group Python loop.
+
+def _group_bounds(symbols):
+    n = len(symbols)
+    positions = np.arange(n)
+    new_group = np.r_[True, symbols[1:] != symbols[:-1]] if n else np.zeros(0, bool)
+    starts = np.maximum.accumulate(np.where(new_group, positions, 0)) if n else positions
+    last_of_group = np.r_[new_group[1:], True] if n else new_group
+    ends = np.minimum.accumulate(np.where(last_of_group, positions + 1, n)[::-1])[::-1] if n else positions
+    return starts, ends
+
+def _shift(values, starts, ends, k):
+    """values[i - k] within the same group (k > 0 looks back, k < 0 looks ahead), else NaN."""
+    positions = np.arange(len(values))
+    source = positions - k
+    valid = (source >= starts) & (source < ends)
+    out = np.full(len(values), np.nan)
+    out[valid] = values[source[valid]]
+    return out
+
+def _rolling_sums(arrays, starts, window):
+    """Windowed sums of each array over the last `window` rows of the group, plus the count of
+    rows where every array is non-NaN. Windows that reach before the group start are NaN."""
+    n = len(starts)
+    positions = np.arange(n)
+    valid = np.ones(n, bool)
+    for a in arrays:
+        valid &= ~np.isnan(a)
+    lo = positions - window + 1
+    full = lo >= starts
+    lo = np.clip(lo, 0, None)
+
+    def window_sum(a):
+        cs = np.concatenate([[0.0], np.cumsum(np.where(valid, a, 0.0))])
+        return cs[positions + 1] - cs[lo]
+
+    count = window_sum(np.ones(n))
+    count[~full] = np.nan
+    return [window_sum(a) for a in arrays], count
+
+def _rolling_mean(x, starts, window):
+    (sx,), n = _rolling_sums([x], starts, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(n == window, sx / n, np.nan)
+
+def _rolling_std(x, starts, window):
+    (sx, sxx), n = _rolling_sums([x, x * x], starts, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var = (sxx - sx * sx / n) / (n - 1)
+        return np.where(n == window, np.sqrt(np.clip(var, 0, None)), np.nan)
+
+def _rolling_corr(x, y, starts, window):
+    (sx, sy, sxx, syy, sxy), n = _rolling_sums([x, y, x * x, y * y, x * y], starts, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sxy - sx * sy / n
+        var_x = sxx - sx * sx / n
+        var_y = syy - sy * sy / n
+        corr = cov / np.sqrt(var_x * var_y)
+    # Constant sentiment over the window (e.g. no news) → correlation undefined
+    return np.where((n == window) & (var_x > 1e-12) & (var_y > 1e-12), np.clip(corr, -1, 1), np.nan)
+
+# -----------------------------
+# Sentiment–return analytics
+# -----------------------------
+@timed("preprocess_seconds", stage="analytics")
+def compute_analytics(merged):
+    """Per (symbol, ts) for every ticker at once:
+
+    return_{h}d          trailing h-bar close-to-close return
+    fwd_return_{h}d      next h-bar return (NaN until those bars exist)
+    sentiment_roll       mean sentiment_score over the last SENTIMENT_WINDOW bars
+    sentiment_return_corr  correlation of the previous bar's sentiment with the bar's return, over CORR_WINDOW
+    news_z               news_count z-score against the previous ZSCORE_WINDOW bars
+    """
+    df = pd.DataFrame({
+        'symbol': np.asarray(merged['symbol'].to_numpy(), dtype=object),
+        'ts': pd.DatetimeIndex(pd.to_datetime(merged['ts'], utc=True)),
+        'close': np.asarray(merged['close'].to_numpy(dtype=float, na_value=np.nan)),
+        'sentiment_score': np.asarray(merged['sentiment_score'].to_numpy(dtype=float, na_value=0)),
+        'news_count': np.asarray(merged['news_count'].to_numpy(dtype=float, na_value=0)),
+    }).sort_values(['symbol', 'ts'], kind='stable', ignore_index=True)
+
+    starts, ends = _group_bounds(df['symbol'].to_numpy())
+    close = df['close'].to_numpy()
+    score = df['sentiment_score'].to_numpy()
+    news = df['news_count'].to_numpy()
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for h in RETURN_HORIZONS:
+            df[f'return_{h}d'] = close / _shift(close, starts, ends, h) - 1
+            df[f'fwd_return_{h}d'] = _shift(close, starts, ends, -h) / close - 1
+
+        df['sentiment_roll'] = _rolling_mean(score, starts, SENTIMENT_WINDOW)
+        df['sentiment_return_corr'] = _rolling_corr(
+            _shift(score, starts, ends, 1), df['return_1d'].to_numpy(), starts, CORR_WINDOW)
+
+        previous_news = _shift(news, starts, ends, 1)
+        baseline = _rolling_mean(previous_news, starts, ZSCORE_WINDOW)
+        spread = _rolling_std(previous_news, starts, ZSCORE_WINDOW)
+        df['news_z'] = np.where(spread > 0, (news - baseline) / spread, np.nan)
+
+    return df
+
+class SentimentAnalytics:
+    """compute_analytics() for a whole snapshot, kept current by updated() as new bars arrive.
+
+    updated() recomputes only each ticker's new bars plus its last MAX_HORIZON stored bars
+    (whose forward returns were still missing, and whose late news may have changed their
+    sentiment), using LOOKBACK earlier bars as context, so the cost grows with the new data
+    rather than the full history. It returns a new object, so readers holding the previous
+    one never see a half-updated frame.
+    """
+
+    def __init__(self, merged=None, frame=None):
+        # frame: one contiguous block of rows per symbol, in ts order
+        self.frame = compute_analytics(merged) if frame is None else frame
+        self._slices = {key: slice(rows[0], rows[-1] + 1)
+                        for key, rows in self.frame.groupby('symbol', sort=False).indices.items()}
+
+    def updated(self, merged):
+        """Analytics for `merged`, recomputing only each ticker's last MAX_HORIZON stored bars onwards."""
+        if self.frame.empty:
+            return SentimentAnalytics(merged)
+        # Per stored ticker (one contiguous block of rows, sorted by ts): first recomputed row and first context row
+        symbols = list(self._slices)
+        bounds = np.array([(s.start, s.stop) for s in self._slices.values()])
+        tail_start = np.maximum(bounds[:, 0], bounds[:, 1] - MAX_HORIZON)
+        context_start = np.maximum(bounds[:, 0], tail_start - LOOKBACK)
+        cutoff = pd.Series(self.frame['ts'].iloc[tail_start].to_numpy(), index=symbols)
+
+        ts = pd.to_datetime(merged['ts'], utc=True)
+        candidates = merged[((ts >= cutoff.min()) | ~merged['symbol'].isin(symbols)).to_numpy()]
+        incoming_cutoff = candidates['symbol'].map(cutoff)
+        incoming = candidates[(incoming_cutoff.isna() | (pd.to_datetime(candidates['ts'], utc=True) >= incoming_cutoff)).to_numpy()]
+        if incoming.empty:
+            return self
+
+        # Tickers missing from `merged` keep their stored rows untouched
+        refreshed = pd.Index(symbols).isin(incoming['symbol'].unique())
+        lengths = bounds[:, 1] - bounds[:, 0]
+        row_tail_start = np.repeat(np.where(refreshed, tail_start, bounds[:, 1]), lengths)
+        row_context_start = np.repeat(np.where(refreshed, context_start, bounds[:, 1]), lengths)
+        positions = np.arange(len(self.frame))
+        keep = positions < row_tail_start
+        context = self.frame.loc[(positions >= row_context_start) & keep, BASE_COLUMNS]
+
+        recomputed = compute_analytics(pd.concat([context, incoming[BASE_COLUMNS]], ignore_index=True))
+        recomputed_cutoff = recomputed['symbol'].map(cutoff)
+        fresh = recomputed[recomputed_cutoff.isna() | (recomputed['ts'] >= recomputed_cutoff)]
+
+        # Stored rows keep their position in each ticker's block with the fresh rows after them
+        # (new tickers go last): a stable sort on the block number instead of re-sorting on (symbol, ts)
+        fresh_blocks = pd.Index(symbols).get_indexer(fresh['symbol'])
+        new_tickers = fresh_blocks < 0
+        fresh_blocks[new_tickers] = len(symbols) + pd.factorize(fresh['symbol'].to_numpy()[new_tickers])[0]
+        blocks = np.concatenate([np.repeat(np.arange(len(symbols)), lengths)[keep], fresh_blocks])
+        frame = pd.concat([self.frame[keep], fresh], ignore_index=True)
+        return SentimentAnalytics(frame=frame.take(np.argsort(blocks, kind='stable')).reset_index(drop=True))
+
+    def ticker(self, symbol):
+        return self.frame.iloc[self._slices.get(symbol, slice(0, 0))]
+
+    def ranking(self):
+        return ranking(self.frame)
+
+class DashboardAnalytics:
+    """SentimentAnalytics following a dashboard data source across data versions.
+
+    A DashboardSnapshot (which holds `merged`) is folded in with updated() when its version
+    changes; a TickerQueryLayer (pushdown mode) has no merged frame, so each ticker's history
+    is computed on demand and there is no cross-ticker ranking.
+    """
+
+    def __init__(self):
+        self._engine = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def engine(self, data):
+        merged = getattr(data, 'merged', None)
+        if merged is None:
+            return None
+        with self._lock:
+            if self._engine is None:
+                self._engine = SentimentAnalytics(merged)
+            elif data.version != self._version:
+                self._engine = self._engine.updated(merged)
+            self._version = data.version
+            return self._engine
+
+    def ticker(self, data, symbol):
+        engine = self.engine(data)
+        return engine.ticker(symbol) if engine is not None else compute_analytics(data.bars(symbol))
+
+    def ranking(self, data):
+        engine = self.engine(data)
+        return engine.ranking() if engine is not None else None
+
+def with_overlays(bars, analytics):
+    """`bars` of one ticker plus the OVERLAY_COLUMNS of the matching (same ts) analytics rows."""
+    out = bars.copy()
+    rows = pd.Index(analytics['ts']).get_indexer(pd.to_datetime(bars['ts'], utc=True))
+    for col in OVERLAY_COLUMNS:
+        values = np.append(analytics[col].to_numpy(dtype=float), np.nan)
+        out[col] = values[rows]   # -1 (no match) → the trailing NaN
+    return out
+
+def ranking(frame):
+    """Cross-ticker table from each ticker's latest bar, strongest sentiment→return relationship
+    (largest absolute correlation, positive or negative) first."""
+    latest = frame.groupby('symbol', sort=False).tail(1)
+    table = pd.DataFrame({
+        'Ticker': latest['symbol'],
+        'Date': latest['ts'].dt.date,
+        'Close': latest['close'].round(2),
+        f'{MAX_HORIZON}d Return %': (latest[f'return_{MAX_HORIZON}d'] * 100).round(2),
+        f'{SENTIMENT_WINDOW}d Sentiment': latest['sentiment_roll'].round(2),
+        f'{CORR_WINDOW}d Sentiment→Return Corr': latest['sentiment_return_corr'].round(3),
+        'News Volume Z': latest['news_z'].round(2),
+    })
+    corr = table[f'{CORR_WINDOW}d Sentiment→Return Corr']
+    return table.iloc[np.argsort(-corr.abs().fillna(-np.inf).to_numpy(), kind='stable')].reset_index(drop=True)
@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import argparse
+import requests
+import pandas as pd
+import pyarrow as pa
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import fetch_data_news as news
+import fetch_data_stock as stock
+from storage import get_backend
+from metrics import configure_logging, inc, log_event, log_run_summary
+from polygon_client import PolygonClient, TokenBucket, make_session
+
+# -----------------------------
+# Config
+# -----------------------------
+CHECKPOINT_PATH = os.environ.get("BACKFILL_CHECKPOINT", os.path.join(".cache", "backfill", "checkpoint.json"))
+NEWS_WINDOW_DAYS = int(os.environ.get("BACKFILL_NEWS_WINDOW_DAYS", 30))          # days of news per unit
+BARS_BATCH_ROWS = int(os.environ.get("BACKFILL_BARS_BATCH_ROWS", 500_000))       # bar rows per load
+NEWS_BATCH_ROWS = int(os.environ.get("BACKFILL_NEWS_BATCH_ROWS", 50_000))        # articles per load
+KINDS = ("bars", "news")
+
+# -----------------------------
+# Work units: (kind, symbol, window)
+# -----------------------------
+def news_windows(start_date, end_date, days=NEWS_WINDOW_DAYS):
+    """Consecutive (start, end) windows of `days` days covering [start_date, end_date].
+
+    Each window ends on the next one's start date, because published_utc.lte=<date> may stop at
+    that day's midnight; articles on a shared boundary are fetched twice and merged away on id.
+    """
+    start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    stop = datetime.strptime(end_date, "%Y-%m-%d").date() + timedelta(days=1)
+    windows = []
+    while start < stop:
+        window_end = min(stop, start + timedelta(days=days))
+        windows.append((start.isoformat(), window_end.isoformat()))
+        start = window_end
+    return windows
+
+def make_units(symbols, start_date, end_date, kinds=KINDS, timespan="day", multiplier=1):
+    """Every (kind, symbol, start, end) unit of the backfill, keyed by a stable id for the checkpoint."""
+    units = {}
+    for symbol in symbols:
+        if "bars" in kinds:
+            for start, end in stock.date_windows(start_date, end_date, timespan):
+                units[f"bars:{multiplier}{timespan}:{symbol}:{start}:{end}"] = ("bars", symbol, start, end)
+        if "news" in kinds:
+            for start, end in news_windows(start_date, end_date):
+                units[f"news:{symbol}:{start}:{end}"] = ("news", symbol, start, end)
+    return units
+
+def fetch_unit(client, unit, timespan="day", multiplier=1):
+    """Bars → Arrow table, news → DataFrame of normalized articles."""
+    kind, symbol, start, end = unit
+    if kind == "bars":
+        return stock.fetch_stock_data(symbol, start_date=start, end_date=end, client=client,
+                                      timespan=timespan, multiplier=multiplier)
+    chunks = list(news.iter_news_chunks(news.iter_news_pages(symbol, start, end, client), chunk_size=news.PAGE_LIMIT))
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=news.NEWS_COLUMNS)
+
+# -----------------------------
+# Checkpoint of completed units
+# -----------------------------
+class Checkpoint:
+    """Ids of units whose rows are loaded, in a JSON file rewritten atomically after every load."""
+
+    def __init__(self, path=CHECKPOINT_PATH):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                self.done = set(json.load(f)["done"])
+
+    def mark(self, unit_ids):
+        if not unit_ids:
+            return
+        self.done.update(unit_ids)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"updated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                       "done": sorted(self.done)}, f)
+        os.replace(tmp_path, self.path)   # a crash mid-write keeps the previous checkpoint
+
+# -----------------------------
+# Batched loads
+# -----------------------------
+class LoadBatch:
+    """Fetched units of one kind waiting for a single load; their ids are checkpointed once it lands
+    (for news, once daily_sentiment is refreshed for the loaded days)."""
+
+    def __init__(self, kind, batch_rows, mode, timespan="day"):
+        self.kind = kind
+        self.batch_rows = batch_rows
+        self.mode = mode
+        self.timespan = timespan
+        self.frames, self.unit_ids, self.rows = [], [], 0
+        self.loaded = 0
+
+    def add(self, unit_id, frame):
+        self.unit_ids.append(unit_id)
+        rows = frame.num_rows if self.kind == "bars" else len(frame)
+        if rows:
+            self.frames.append(frame)
+            self.rows += rows
+        return self.rows >= self.batch_rows
+
+    def flush(self, checkpoint):
+        if self.frames and self.kind == "bars":
+            stock.load_to_bigquery(pa.concat_tables(self.frames), mode=self.mode, timespan=self.timespan)
+            self.loaded += self.rows
+        elif self.frames:
+            # One article mentions several tickers: keep one row per id so the MERGE source is unique
+            df = pd.concat(self.frames, ignore_index=True).drop_duplicates("id")
+            news.load_to_bigquery(df, mode=self.mode)
+            self.loaded += len(df)
+            # Aggregate before checkpointing, so a resumed run never leaves loaded news out of daily_sentiment
+            # Only the batch's own days: a full-history refresh per batch would grow with history
+            earliest, latest = df["published_utc"].min(), df["published_utc"].max()
+            if pd.notna(earliest):
+                get_backend().refresh_daily_sentiment(since=earliest.date(), until=latest.date())
+        checkpoint.mark(self.unit_ids)
+        self.frames, self.unit_ids, self.rows = [], [], 0
+
+# -----------------------------
+# Backfill
+# -----------------------------
+def backfill(symbols, start_date, end_date, kinds=KINDS, timespan="day", multiplier=1,
+             max_workers=stock.MAX_WORKERS, requests_per_minute=stock.REQUESTS_PER_MINUTE,
+             checkpoint_path=CHECKPOINT_PATH, bars_batch_rows=BARS_BATCH_ROWS,
+             news_batch_rows=NEWS_BATCH_ROWS, mode=stock.LOAD_MODE):
+    """Fetch every (kind, symbol, window) unit not in the checkpoint on `max_workers` threads.
+
+    At most 2 × `max_workers` units are in flight, so memory stays bounded by the pool and one
+    pending batch per kind. Loads run on this thread in batches of ~`*_batch_rows` rows, and a
+    unit is checkpointed only after its rows are loaded: an interrupted run loses at most the
+    unloaded batch and resumes from the checkpoint. Failed units (request errors and Polygon
+    error responses) are left out of the checkpoint and retried by the next run.
+    Returns {"done", "failed", "skipped", "bars", "news"} counts.
+    """
+    checkpoint = Checkpoint(checkpoint_path)
+    units = make_units(symbols, start_date, end_date, kinds, timespan, multiplier)
+    todo = [(unit_id, unit) for unit_id, unit in units.items() if unit_id not in checkpoint.done]
+    skipped = len(units) - len(todo)
+    for unit_id in checkpoint.done.intersection(units):
+        inc("backfill_units_total", kind=units[unit_id][0], result="skipped")
+    print(f"✅ {len(units)} units for {len(symbols)} symbols {start_date}..{end_date}: "
+          f"{skipped} already done, {len(todo)} to fetch")
+
+    batches = {"bars": LoadBatch("bars", bars_batch_rows, mode, timespan),
+               "news": LoadBatch("news", news_batch_rows, mode)}
+    limiter = TokenBucket(requests_per_minute)
+    done, failed = 0, 0
+    queue = iter(todo)
+
+    with PolygonClient(make_session(max_workers), limiter) as client, \
+            ThreadPoolExecutor(max_workers=max_workers) as pool:
+        in_flight = {}
+
+        def submit_next():
+            for unit_id, unit in queue:
+                in_flight[pool.submit(fetch_unit, client, unit, timespan, multiplier)] = (unit_id, unit)
+                return
+
+        for _ in range(2 * max_workers):
+            submit_next()
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                unit_id, (kind, symbol, start, end) = in_flight.pop(future)
+                submit_next()
+                try:
+                    frame = future.result()
+                except requests.RequestException as e:
+                    failed += 1
+                    inc("backfill_units_total", kind=kind, result="failed")
+                    log_event("backfill_unit", unit=unit_id, result="failed", error=str(e))
+                    print(f"❌ {kind} {symbol} {start}..{end} failed: {e}")
+                    continue
+                done += 1
+                inc("backfill_units_total", kind=kind, result="done")
+                if batches[kind].add(unit_id, frame):
+                    batches[kind].flush(checkpoint)
+                if done % 100 == 0:
+                    print(f"✅ {done + failed}/{len(todo)} units fetched ({failed} failed)")
+        for batch in batches.values():
+            batch.flush(checkpoint)
+
+    summary = {"done": done, "failed": failed, "skipped": skipped,
+               "bars": batches["bars"].loaded, "news": batches["news"].loaded}
+    print(f"✅ Backfill finished: {done} units loaded ({summary['bars']} bars, {summary['news']} news rows), "
+          f"{failed} failed, {skipped} skipped")
+    log_event("backfill", symbols=len(symbols), start=start_date, end=end_date, **summary)
+    return summary
+
+def read_symbols(path):
+    """One ticker per line; blank lines and # comments are ignored."""
+    with open(path) as f:
+        return [line.split("#")[0].strip().upper() for line in f if line.split("#")[0].strip()]
+
+# -----------------------------
+# Main
+# -----------------------------
+if __name__ == "__main__":
+    yesterday = (datetime.now(timezone.utc) - timedelta(days=1)).strftime("%Y-%m-%d")
+    parser = argparse.ArgumentParser(description="Resumable parallel backfill of Polygon bars and news into storage")
+    parser.add_argument("symbols", nargs="*", help="Tickers to backfill")
+    parser.add_argument("--watchlist", action="store_true", help="Backfill every ticker in WATCHLIST")
+    parser.add_argument("--symbols-file", help="File with one ticker per line")
+    parser.add_argument("--start", required=True, help="First day (YYYY-MM-DD)")
+    parser.add_argument("--end", default=yesterday, help="Last day (YYYY-MM-DD, default: yesterday)")
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS))
+    parser.add_argument("--timespan", choices=["minute", "hour", "day"], default="day",
+                        help="Bar timespan; minute/hour bars go to stock_intraday")
+    parser.add_argument("--multiplier", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=stock.MAX_WORKERS)
+    parser.add_argument("--rpm", type=float, default=stock.REQUESTS_PER_MINUTE,
+                        help="Polygon requests per minute (0 = unlimited)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="JSON file of completed units")
+    parser.add_argument("--restart", action="store_true", help="Ignore and overwrite the checkpoint")
+    parser.add_argument("--bars-batch-rows", type=int, default=BARS_BATCH_ROWS)
+    parser.add_argument("--news-batch-rows", type=int, default=NEWS_BATCH_ROWS)
+    parser.add_argument("--mode", choices=["merge", "append"], default=stock.LOAD_MODE,
+                        help="merge = upsert (safe to re-run a unit), append = plain append")
+    args = parser.parse_args()
+    configure_logging()
+    started = time.perf_counter()
+
+    symbols = list(stock.WATCHLIST) if args.watchlist else list(args.symbols)
+    if args.symbols_file:
+        symbols += read_symbols(args.symbols_file)
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        parser.error("no symbols (pass tickers, --watchlist or --symbols-file)")
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    summary = backfill(symbols, args.start, args.end, kinds=args.kinds, timespan=args.timespan,
+                       multiplier=args.multiplier, max_workers=args.workers, requests_per_minute=args.rpm,
+                       checkpoint_path=args.checkpoint, bars_batch_rows=args.bars_batch_rows,
+                       news_batch_rows=args.news_batch_rows, mode=args.mode)
+    log_run_summary("backfill", started)
+    if summary["failed"]:
+        raise SystemExit(f"⚠️ {summary['failed']} units failed; run the same command again to retry them")
@@ -0,0 +1,76 @@
+"""
+Micro-benchmark: Polygon aggregate results → stock_daily rows.
+
+Compares the original per-row loop (utcfromtimestamp + list of dicts + pd.DataFrame)
+with the column-wise Arrow path in fetch_data_stock.normalize_bars.
+
+Usage:  python benchmarks/bench_normalize_bars.py [--rows 10000 100000 1000000]
+"""
+import os
+import sys
+import time
+import argparse
+import random
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fetch_data_stock import normalize_bars  # noqa: E402
+
+
+def make_results(n):
+    """Polygon-shaped minute bars starting 2020-01-01."""
+    t0 = 1577836800000
+    rng = random.Random(42)
+    out = []
+    for i in range(n):
+        o = 100 + rng.random() * 10
+        out.append({"v": float(rng.randint(1_000, 1_000_000)), "vw": o + 0.1, "o": o,
+                    "c": o + 0.5, "h": o + 1, "l": o - 1, "t": t0 + i * 60_000, "n": rng.randint(10, 5_000)})
+    return out
+
+
+def legacy_normalize(results, symbol):
+    """The original fetch_stock_data loop, kept verbatim for comparison."""
+    rows = []
+    for r in results:
+        ts = datetime.utcfromtimestamp(r["t"] / 1000)  # convert ms → datetime
+        rows.append({
+            "symbol": symbol,
+            "ts": ts,
+            "open": r.get("o"),
+            "high": r.get("h"),
+            "low": r.get("l"),
+            "close": r.get("c"),
+            "volume": r.get("v"),
+            "vwap": r.get("vw"),
+            "trades_count": r.get("n")
+        })
+    return pd.DataFrame(rows)
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    import warnings
+    warnings.filterwarnings("ignore", category=DeprecationWarning)  # utcfromtimestamp on 3.12+
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'loop rows/s':>14} {'arrow rows/s':>14} {'speedup':>8}")
+    for n in args.rows:
+        results = make_results(n)
+        before = best_of(lambda: legacy_normalize(results, "NFLX"), args.repeat)
+        after = best_of(lambda: normalize_bars(results, "NFLX"), args.repeat)
+        print(f"{n:>10,} {n / before:>14,.0f} {n / after:>14,.0f} {before / after:>7.1f}x")
@@ -0,0 +1,176 @@
+"""
+Benchmark: dashboard query reads, current path vs Arrow-native (BigQuery Storage Read API).
+
+  rest    what query() did before: results downloaded through the paginated REST API
+          (tabledata.list JSON pages) and decoded to NumPy/object pandas columns
+  arrow   query(..., arrow=True): parallel Storage Read API streams of Arrow record batches,
+          decoded to Arrow-backed (ArrowDtype) columns
+
+Each (query, path) runs in a fresh interpreter, so peak RSS and the Arrow memory pool's
+high-water mark belong to that read alone. Reported per run: download s, decode s, rows,
+DataFrame bytes (deep), peak RSS above the RSS before the read, Arrow pool peak.
+
+With STORAGE_BACKEND=duckdb the same code reads a local DuckDB file instead (no REST/Read API,
+so only the decode step differs); `--synthetic` fills a temporary DuckDB file with
+benchmarks/synthetic.py data first, which runs without cloud credentials.
+
+Usage:  python benchmarks/bench_read.py [--tables price_sentiment news_insights stock_news]
+            [--synthetic --tickers 10 --years 2] [--output benchmarks/results/read.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "read.json")
+PATHS = ("rest", "arrow")
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:   # Linux only
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+class PeakRss:
+    """Highest RSS seen while the block runs (sampled every `interval` s), minus the RSS at entry.
+
+    ru_maxrss is not used: the interpreter's import-time peak would hide smaller reads.
+    """
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._done = threading.Event()
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, rss_mb() - self.baseline_mb)
+
+    def __enter__(self):
+        self.baseline_mb = rss_mb()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, rss_mb() - self.baseline_mb)
+        return False
+
+
+# -----------------------------
+# One read (runs in a child process)
+# -----------------------------
+def download(backend, sql, path):
+    """Query result as an Arrow table through the REST pages ("rest") or the Storage Read API ("arrow")."""
+    import pyarrow as pa
+
+    if backend.name == "bigquery":
+        rows = backend.client.query(sql).result()
+        return rows.to_arrow(create_bqstorage_client=path == "arrow")
+    table = backend._cursor().execute(sql).arrow()
+    return table.read_all() if isinstance(table, pa.RecordBatchReader) else table
+
+
+def read_once(table_name, path):
+    import pyarrow as pa
+    from storage import arrow_frame, get_backend
+
+    backend = get_backend()
+    sql = f"SELECT * FROM {backend.table(table_name)}"
+
+    with PeakRss() as memory:
+        start = time.perf_counter()
+        table = download(backend, sql, path)
+        download_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        df = arrow_frame(table) if path == "arrow" else table.to_pandas()
+        decode_s = time.perf_counter() - start
+
+    return {
+        "table": table_name,
+        "path": path,
+        "backend": backend.name,
+        "rows": len(df),
+        "download_s": round(download_s, 4),
+        "decode_s": round(decode_s, 4),
+        "frame_mb": round(df.memory_usage(deep=True).sum() / 1e6, 2),
+        "peak_rss_mb": round(memory.peak_mb, 1),
+        "arrow_pool_peak_mb": round(pa.default_memory_pool().max_memory() / 1e6, 1),
+        "dtypes": sorted({str(dtype) for dtype in df.dtypes}),
+    }
+
+
+def run_child(table_name, path, env):
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", table_name, path],
+                         capture_output=True, text=True, env=env, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+# -----------------------------
+# Synthetic DuckDB source
+# -----------------------------
+def synthetic_duckdb(scale):
+    """Temporary DuckDB file with synthetic stock_daily / stock_news / daily_sentiment; returns its path."""
+    import pyarrow as pa
+    from synthetic import make_aggregates, make_news, pages
+    from fetch_data_stock import normalize_bars
+    from fetch_data_news import iter_news_chunks
+    from storage import DuckDBBackend
+
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-read-"), "bench.duckdb")
+    backend = DuckDBBackend(path)
+    backend.create_tables()
+    backend.load("stock_daily", pa.concat_tables([normalize_bars(results, s)
+                                                  for s, results in make_aggregates(scale).items()]))
+    for chunk in iter_news_chunks(pages(make_news(scale))):
+        backend.load("stock_news", chunk)
+    backend.refresh_daily_sentiment()
+    backend.conn.close()
+    return path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        print(json.dumps(read_once(sys.argv[2], sys.argv[3])))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tables", nargs="+", default=["price_sentiment", "news_insights", "stock_news"])
+    parser.add_argument("--synthetic", action="store_true", help="Read a temporary DuckDB file of synthetic data")
+    parser.add_argument("--tickers", type=int, default=10)
+    parser.add_argument("--years", type=float, default=2)
+    parser.add_argument("--articles-per-day", type=int, default=20)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if args.synthetic:
+        from synthetic import Scale
+
+        scale = Scale(args.tickers, args.years, args.articles_per_day)
+        env.update(STORAGE_BACKEND="duckdb", DUCKDB_PATH=synthetic_duckdb(scale))
+        print(f"✅ Synthetic DuckDB source at {env['DUCKDB_PATH']}")
+
+    runs = [run_child(table_name, path, env) for table_name in args.tables for path in PATHS]
+
+    print(f"\n{'table':<16} {'path':<6} {'rows':>9} {'download s':>11} {'decode s':>9} "
+          f"{'frame MB':>9} {'peak RSS MB':>12} {'arrow MB':>9}")
+    for r in runs:
+        print(f"{r['table']:<16} {r['path']:<6} {r['rows']:>9,} {r['download_s']:>11.3f} {r['decode_s']:>9.3f} "
+              f"{r['frame_mb']:>9.1f} {r['peak_rss_mb']:>12.1f} {r['arrow_pool_peak_mb']:>9.1f}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({"benchmark": "read", "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                   "runs": runs}, f, indent=2)
+    print(f"\n✅ Results written to {args.output}")
@@ -0,0 +1,101 @@
+"""
+Scaling benchmark: news insights → daily sentiment per (ticker, date).
+
+Compares the original dashboard code (row-wise .apply, groupby(...).apply(list) and a
+Python sentiment_score loop) with preprocessing.expand_insights + compute_daily_sentiment.
+
+Usage:  python benchmarks/bench_sentiment.py [--insights 10000 100000 1000000 10000000] [--legacy-max 1000000]
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from preprocessing import expand_insights, compute_daily_sentiment  # noqa: E402
+
+TICKERS = [f"T{i:03d}" for i in range(200)]
+SENTIMENTS = np.array(["positive", "neutral", "negative"], dtype=object)
+
+
+def make_news(n_insights, insights_per_article=2, days=365, seed=0):
+    """stock_news-shaped frame whose `insights` lists hold `n_insights` records in total."""
+    rng = np.random.default_rng(seed)
+    n_articles = max(1, n_insights // insights_per_article)
+    tickers = rng.choice(len(TICKERS), size=n_articles * insights_per_article)
+    sentiments = SENTIMENTS[rng.integers(0, 3, size=n_articles * insights_per_article)]
+    insights = [
+        [{"ticker": TICKERS[tickers[j]], "sentiment": sentiments[j], "sentiment_reasoning": "..."}
+         for j in range(i * insights_per_article, (i + 1) * insights_per_article)]
+        for i in range(n_articles)
+    ]
+    published = pd.Timestamp("2024-01-01", tz="UTC") + pd.to_timedelta(
+        rng.integers(0, days * 86_400, size=n_articles), unit="s")
+    return pd.DataFrame({
+        "id": np.arange(n_articles).astype(str),
+        "title": "headline",
+        "article_url": [f"https://example.com/news/{i}" for i in range(n_articles)],
+        "published_utc": published,
+        "insights": insights,
+    })
+
+
+def legacy_daily_sentiment(df_news):
+    """The original dashboard preprocessing, kept verbatim for comparison."""
+    news_expanded = df_news.explode('insights').reset_index(drop=True)
+    news_expanded['sentiment'] = news_expanded['insights'].apply(lambda x: x.get('sentiment') if isinstance(x, dict) else np.nan)
+    news_expanded['ticker'] = news_expanded['insights'].apply(lambda x: x.get('ticker') if isinstance(x, dict) else np.nan)
+    news_expanded = news_expanded.dropna(subset=['sentiment', 'ticker'])
+    news_expanded['date'] = pd.to_datetime(news_expanded['published_utc']).dt.date
+
+    daily_sentiment = news_expanded.groupby(['ticker', 'date'])['sentiment'].apply(list).reset_index()
+
+    def sentiment_score(lst):
+        score = 0
+        for s in lst:
+            if s == 'positive':
+                score += 1
+            elif s == 'negative':
+                score -= 1
+        return score
+
+    daily_sentiment['sentiment_score'] = daily_sentiment['sentiment'].apply(sentiment_score)
+    daily_sentiment['news_count'] = daily_sentiment['sentiment'].apply(len)
+    return daily_sentiment
+
+
+def vectorized_daily_sentiment(df_news):
+    return compute_daily_sentiment(expand_insights(df_news))
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return time.perf_counter() - start, out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--insights", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 10_000_000])
+    parser.add_argument("--legacy-max", type=int, default=1_000_000,
+                        help="Skip the legacy path above this many insights (it is minutes at 10M)")
+    args = parser.parse_args()
+
+    print(f"{'insights':>12} {'legacy s':>10} {'vectorized s':>13} {'speedup':>8}")
+    for n in args.insights:
+        df_news = make_news(n)
+        after, new = timed(vectorized_daily_sentiment, df_news)
+        if n <= args.legacy_max:
+            before, old = timed(legacy_daily_sentiment, df_news)
+            # Same scores as the original code
+            key = ['ticker', 'date']
+            check = old.merge(new, on=key, suffixes=('_old', '_new'))
+            assert len(check) == len(old) == len(new)
+            assert (check['sentiment_score_old'] == check['sentiment_score_new']).all()
+            assert (check['news_count_old'] == check['news_count_new']).all()
+            print(f"{n:>12,} {before:>10.2f} {after:>13.2f} {before / after:>7.1f}x")
+        else:
+            print(f"{n:>12,} {'-':>10} {after:>13.2f} {'-':>8}")
@@ -0,0 +1,97 @@
+"""
+Synthetic Polygon payloads for the benchmarks.
+
+Scale is tickers × years × articles/day × insights/article. Aggregates look like the
+`results` of /v2/aggs (one bar per weekday), news like the `results` of /v2/reference/news,
+so they go through the same normalization code as real API responses.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+SENTIMENTS = np.array(["positive", "neutral", "negative"], dtype=object)
+START = "2020-01-01"
+
+
+@dataclass
+class Scale:
+    tickers: int = 10
+    years: float = 2
+    articles_per_day: int = 20
+    insights_per_article: int = 3
+    seed: int = 0
+
+    def symbols(self):
+        return [f"T{i:03d}" for i in range(self.tickers)]
+
+    def days(self):
+        return pd.date_range(START, periods=int(self.years * 365), freq="D", tz="UTC")
+
+
+def make_aggregates(scale):
+    """{symbol: [Polygon aggregate bar dicts]} with a random walk per ticker, weekdays only."""
+    rng = np.random.default_rng(scale.seed)
+    days = scale.days()
+    days = days[days.dayofweek < 5]
+    t_ms = days.as_unit("ms").asi8.tolist()
+
+    payloads = {}
+    for symbol in scale.symbols():
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(days))))
+        open_ = close * (1 + rng.normal(0, 0.005, len(days)))
+        high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.01, len(days)))
+        low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.01, len(days)))
+        volume = rng.integers(100_000, 10_000_000, len(days)).astype(float)
+        trades = rng.integers(1_000, 100_000, len(days))
+        payloads[symbol] = [
+            {"v": v, "vw": (o + c) / 2, "o": o, "c": c, "h": h, "l": l, "t": t, "n": int(n)}
+            for v, o, c, h, l, t, n in zip(volume.tolist(), open_.tolist(), close.tolist(),
+                                           high.tolist(), low.tolist(), t_ms, trades.tolist())
+        ]
+    return payloads
+
+
+def make_news(scale):
+    """List of Polygon news article dicts, `articles_per_day` per calendar day.
+
+    Each article mentions `insights_per_article` random tickers of the watchlist, with one
+    insight (ticker, sentiment, reasoning) per mentioned ticker.
+    """
+    rng = np.random.default_rng(scale.seed + 1)
+    symbols = np.array(scale.symbols(), dtype=object)
+    days = scale.days()
+    n_articles = len(days) * scale.articles_per_day
+    per_article = min(scale.insights_per_article, len(symbols))
+
+    published = (days.repeat(scale.articles_per_day)
+                 + pd.to_timedelta(rng.integers(0, 86_400, n_articles), unit="s"))
+    published = published.strftime("%Y-%m-%dT%H:%M:%SZ").tolist()
+    mentioned = symbols[rng.integers(0, len(symbols), (n_articles, per_article))].tolist()
+    sentiments = SENTIMENTS[rng.integers(0, 3, (n_articles, per_article))].tolist()
+
+    return [
+        {
+            "id": f"a{i}",
+            "publisher": {"name": "Synthetic Wire", "homepage_url": "https://example.com/",
+                          "logo_url": None, "favicon_url": None},
+            "title": f"Headline {i}",
+            "author": "Staff",
+            "published_utc": published[i],
+            "article_url": f"https://example.com/news/{i}",
+            "tickers": mentioned[i],
+            "description": "Synthetic article body.",
+            "keywords": ["markets"],
+            "insights": [
+                {"ticker": t, "sentiment": s, "sentiment_reasoning": "synthetic"}
+                for t, s in zip(mentioned[i], sentiments[i])
+            ],
+        }
+        for i in range(n_articles)
+    ]
+
+
+def pages(articles, page_size=1000):
+    """Split articles into Polygon-sized pages (what iter_news_pages yields)."""
+    for start in range(0, len(articles), page_size):
+        yield articles[start:start + page_size]
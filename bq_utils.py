@@ -0,0 +1,52 @@
+import uuid
+from google.cloud import bigquery
+
+# -----------------------------
+# Idempotent loads: staging table + MERGE
+# -----------------------------
+def staging_table_id(table_id):
+    """Unique scratch table next to `table_id`, so concurrent runs never share a staging table."""
+    return f"{table_id}_staging_{uuid.uuid4().hex[:8]}"
+
+def merge_from_staging(client, table_id, staging_id, keys, columns, partition_column=None, partition_range=None):
+    """MERGE `staging_id` into `table_id` on `keys` (update on match, insert otherwise), then drop the staging table.
+
+    Duplicate keys inside the staging batch are collapsed first, because MERGE rejects
+    several source rows matching the same target row. `partition_range` (min, max) on
+    `partition_column` limits the target scan to the partitions the batch can touch.
+    """
+    on = " AND ".join(f"T.`{k}` = S.`{k}`" for k in keys)
+    if partition_column and partition_range:
+        on += f" AND T.`{partition_column}` BETWEEN @range_start AND @range_end"
+    updates = ", ".join(f"`{c}` = S.`{c}`" for c in columns if c not in keys)
+    column_list = ", ".join(f"`{c}`" for c in columns)
+    source_list = ", ".join(f"S.`{c}`" for c in columns)
+    partition_keys = ", ".join(f"`{k}`" for k in keys)
+
+    query = f"""
+        MERGE `{table_id}` T
+        USING (
+            SELECT * EXCEPT(_rn) FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY {partition_keys}) AS _rn
+                FROM `{staging_id}`
+            )
+            WHERE _rn = 1
+        ) S
+        ON {on}
+        WHEN MATCHED THEN UPDATE SET {updates}
+        WHEN NOT MATCHED THEN INSERT ({column_list}) VALUES ({source_list})
+    """
+    params = []
+    if partition_column and partition_range:
+        params = [
+            bigquery.ScalarQueryParameter("range_start", "TIMESTAMP", partition_range[0]),
+            bigquery.ScalarQueryParameter("range_end", "TIMESTAMP", partition_range[1]),
+        ]
+
+    try:
+        job = client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=params))
+        job.result()  # Wait for MERGE to finish
+    finally:
+        client.delete_table(staging_id, not_found_ok=True)
+
+    return job.num_dml_affected_rows
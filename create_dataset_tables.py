@@ -1,97 +1,35 @@
-from google.cloud import bigquery
-from google.api_core.exceptions import Conflict
+import argparse
 
-# Step 3a: Set your project and dataset
-PROJECT = "project-portfolio-473015"   # replace with your project ID
-DATASET = "stock_data_append"       # desired dataset name
+from storage import STORAGE_BACKEND, get_backend
 
-# Step 3b: Initialize BigQuery client
-client = bigquery.Client(project=PROJECT)
+# Step 3a: Project, dataset and the backend itself are configured in storage.py
+# (STORAGE_BACKEND=bigquery|duckdb, GCP_PROJECT_ID, BQ_DATASET, DUCKDB_PATH)
 
-# Step 3c: Create dataset
+# Step 3b: Create dataset
 def create_dataset():
-    dataset_ref = bigquery.Dataset(f"{PROJECT}.{DATASET}")
-    dataset_ref.location = "US"  # choose location
-    try:
-        client.create_dataset(dataset_ref)
-        print(f"Dataset {DATASET} created successfully!")
-    except Conflict:
-        print(f"Dataset {DATASET} already exists.")
+    get_backend().create_dataset()
 
-# Step 3d: Create tables
+# Step 3c: Create tables (stock_daily, stock_news, daily_sentiment) and the dashboard views
 def create_tables():
-    # --- Table 1: stock_daily ---
-    stock_daily_schema = [
-        bigquery.SchemaField("symbol", "STRING"),
-        bigquery.SchemaField("ts", "TIMESTAMP"),
-        bigquery.SchemaField("open", "FLOAT64"),
-        bigquery.SchemaField("high", "FLOAT64"),
-        bigquery.SchemaField("low", "FLOAT64"),
-        bigquery.SchemaField("close", "FLOAT64"),
-        bigquery.SchemaField("volume", "FLOAT64"),
-        bigquery.SchemaField("vwap", "FLOAT64"),
-        bigquery.SchemaField("trades_count", "INT64")
-    ]
-    stock_daily_table_id = f"{PROJECT}.{DATASET}.stock_daily"
-    stock_daily_table = bigquery.Table(stock_daily_table_id, schema=stock_daily_schema)
-    
-    # Partition by ts and cluster by symbol
-    stock_daily_table.time_partitioning = bigquery.TimePartitioning(
-        type_=bigquery.TimePartitioningType.DAY,
-        field="ts"
-    )
-    stock_daily_table.clustering_fields = ["symbol"]
+    get_backend().create_tables()
 
-    # --- Table 2: stock_news ---
-    stock_news_schema = [
-    bigquery.SchemaField("id", "STRING"),
-    bigquery.SchemaField("title", "STRING"),
-    bigquery.SchemaField("author", "STRING"),
-    bigquery.SchemaField("description", "STRING"),
-    bigquery.SchemaField("article_url", "STRING"),
-    bigquery.SchemaField("amp_url", "STRING"),
-    bigquery.SchemaField("image_url", "STRING"),
-    bigquery.SchemaField("published_utc", "TIMESTAMP"),
-    bigquery.SchemaField(
-        "publisher", "RECORD",
-        fields=[
-            bigquery.SchemaField("name", "STRING"),
-            bigquery.SchemaField("homepage_url", "STRING"),
-            bigquery.SchemaField("logo_url", "STRING"),
-            bigquery.SchemaField("favicon_url", "STRING"),
-        ]
-    ),
-    bigquery.SchemaField("tickers", "STRING", mode="REPEATED"),
-    bigquery.SchemaField("keywords", "STRING", mode="REPEATED"),
-    bigquery.SchemaField(
-        "insights", "RECORD", mode="REPEATED",
-        fields=[
-            bigquery.SchemaField("ticker", "STRING"),
-            bigquery.SchemaField("sentiment", "STRING"),
-            bigquery.SchemaField("sentiment_reasoning", "STRING")
-        ]
-    )
-]
-    
-    stock_news_table_id = f"{PROJECT}.{DATASET}.stock_news"
-    stock_news_table = bigquery.Table(stock_news_table_id, schema=stock_news_schema)
-    
-    # Partition by ts and cluster by symbol
-    stock_news_table.time_partitioning = bigquery.TimePartitioning(
-        type_=bigquery.TimePartitioningType.DAY,
-        field="published_utc"
-    )
-    stock_news_table.clustering_fields = ["id"]
+# Step 3d: Server-side sentiment stage
+def refresh_daily_sentiment(since=None, until=None):
+    """Recompute daily_sentiment for every day in [`since`, `until`] (default: all history) with UNNEST over insights."""
+    get_backend().refresh_daily_sentiment(since=since, until=until)
 
-    # Create tables
-    for table in (stock_daily_table, stock_news_table):
-        try:
-            client.create_table(table)
-            print(f"Table {table.table_id} created successfully!")
-        except Conflict:
-            print(f"Table {table.table_id} already exists.")
+# Step 3e: One-off cleanup of duplicates appended before loads switched to MERGE
+def deduplicate_tables():
+    get_backend().deduplicate_tables()
 
-# Step 3e: Run creation
+# Step 3f: Run creation
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=f"Create the {STORAGE_BACKEND} tables and views")
+    parser.add_argument("--dedupe", action="store_true", help="Remove duplicate rows loaded before MERGE")
+    args = parser.parse_args()
+
     create_dataset()
     create_tables()
+    if args.dedupe:
+        deduplicate_tables()
+    refresh_daily_sentiment()
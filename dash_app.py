@@ -1,75 +1,46 @@
-import os, json
+import os
 import pandas as pd
-import numpy as np
 import plotly.graph_objects as go
 from dash import Dash
-from dash import dcc, html
+from dash import dcc, html, ctx, dash_table
 from dash.dependencies import Input, Output
-from google.cloud import bigquery
-from google.oauth2 import service_account
+from dash.exceptions import PreventUpdate
+from flask import Response
+from dashboard_data import (
+    SHARED_DIR, SHARED_POLL_SECONDS, SnapshotRefresher, load_local_snapshot,
+    open_dashboard_data, open_shared_snapshot, warming_snapshot,
+)
+from storage import get_backend
+from metrics import render_prometheus, timed
+from analytics import DashboardAnalytics, with_overlays
+from figures import FigureCache, build_figure, chart_traces, downsample_bars, figure_patch, zoom_window
+from news_table import news_page, dash_news_table, dash_records
 # import streamlit as st
 # from streamlit.components.v1 import iframe
 
-# Read credentials JSON from env var
-creds_dict = json.loads(os.environ["GOOGLE_CREDENTIALS"])
-credentials = service_account.Credentials.from_service_account_info(creds_dict)
-
-# Init BigQuery client
-bq_client = bigquery.Client(credentials=credentials, project=credentials.project_id)
-
 # os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = r"D:\Projects\Profile\Polygon_project\Stock-Market-Analysis-with-News-Sentiment-Overlay\project-portfolio-473015-eedb2f040835.json"
 # bq_client = bigquery.Client()
 
-# Load stock data
-
-df_stock = bq_client.query("""
-    SELECT * FROM `project-portfolio-473015.stock_data_append.stock_daily`
-""").to_dataframe()
-
-# Load news data
-df_news = bq_client.query("""
-    SELECT * FROM `project-portfolio-473015.stock_data_append.stock_news`
-""").to_dataframe()
-
-df_news = df_news.drop_duplicates(subset=['id'], keep='first').reset_index(drop=True)
-
-# Assume your original news dataframe is df_news
-# Explode the 'insights' list into separate rows
-news_expanded = df_news.explode('insights').reset_index(drop=True)
-
-# Extract ticker and sentiment safely
-news_expanded['sentiment'] = news_expanded['insights'].apply(lambda x: x.get('sentiment') if isinstance(x, dict) else np.nan)
-news_expanded['ticker'] = news_expanded['insights'].apply(lambda x: x.get('ticker') if isinstance(x, dict) else np.nan)
-
-# Drop rows with missing sentiment or ticker
-news_expanded = news_expanded.dropna(subset=['sentiment', 'ticker'])
-
-# Add 'date' column if not already present
-news_expanded['date'] = pd.to_datetime(news_expanded['published_utc']).dt.date
-
-# Make sure df_stock['ts'] is datetime
-df_stock['ts'] = pd.to_datetime(df_stock['ts'])
-df_stock['date'] = df_stock['ts'].dt.date
-
-# Compute daily sentiment score for each ticker
-daily_sentiment = news_expanded.groupby(['ticker','date'])['sentiment'].apply(list).reset_index()
-
-def sentiment_score(lst):
-    score = 0
-    for s in lst:
-        if s == 'positive':
-            score += 1
-        elif s == 'negative':
-            score -= 1
-    return score
-
-daily_sentiment['sentiment_score'] = daily_sentiment['sentiment'].apply(sentiment_score)
-daily_sentiment['news_count'] = daily_sentiment['sentiment'].apply(len)
-
-# Merge with stock data
-merged = pd.merge(df_stock, daily_sentiment, left_on=['symbol','date'], right_on=['ticker','date'], how='left')
-merged['sentiment_score'] = merged['sentiment_score'].fillna(0)
-merged['news_count'] = merged['news_count'].fillna(0)
+def load_data():
+    # Prices joined with daily sentiment + news insights, either loaded from the
+    # server-side views (local Parquet snapshot) or queried per ticker on demand
+    # (DASHBOARD_DATA_MODE=pushdown). The storage backend (STORAGE_BACKEND: BigQuery with
+    # GOOGLE_CREDENTIALS, or local DuckDB) is only created by the refresh thread (slow to import).
+    return open_dashboard_data(get_backend())
+
+if SHARED_DIR:
+    # gunicorn workers map the snapshot published by the publisher process (gunicorn.conf.py):
+    # one physical copy for all workers, and no storage queries in any worker
+    refresher = SnapshotRefresher(
+        lambda: open_shared_snapshot(SHARED_DIR, refresher.current),
+        initial=open_shared_snapshot(SHARED_DIR) or warming_snapshot(),
+        interval=SHARED_POLL_SECONDS,
+    )
+    refresher.start()
+else:
+    # Serve the last snapshot on disk (or an empty placeholder) right away; the refresh
+    # thread loads current data and swaps it in every DASHBOARD_REFRESH_SECONDS
+    refresher = SnapshotRefresher(load_data, initial=load_local_snapshot() or warming_snapshot()).start()
 
 
 # --- Initialize Dash app ---
@@ -78,114 +49,155 @@ app = Dash(__name__)
 # Expose the server for deployment
 server = app.server   
 
-# Get unique tickers from the stock data
-available_tickers = df_stock['symbol'].unique()
-
-# Dropdown options based on available stock tickers
-tickers_options = [{'label': t, 'value': t} for t in available_tickers]
-
-app.layout = html.Div([
-    html.H2("Stock Price with News Sentiment"),
-    
-    html.Div([
-        html.Label("Select Ticker:"),
-        dcc.Dropdown(
-            id='ticker-filter',
-            options=tickers_options,
-            value=available_tickers[0],  # default selection
-            clearable=False
-        )
-    ], style={'width': '200px', 'margin-bottom': '20px'}),
-    
-    dcc.Graph(id='candlestick-chart'),
-    html.H4("News Details"),
-    html.Div(id='news-table')
-])
+# Prometheus scrape target: Polygon/storage/preprocessing/callback timers and cache counters
+# (per process: with several gunicorn workers each scrape sees the worker that answered)
+@server.route("/metrics")
+def metrics():
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+# Per-ticker trace arrays, reused across callbacks until the data version changes
+figure_cache = FigureCache(max_entries=int(os.environ.get("FIGURE_CACHE_SIZE", 64)))
+
+# Rolling sentiment/return analytics, updated incrementally when a new snapshot is swapped in
+analytics = DashboardAnalytics()
+
+def ticker_traces(data, ticker, start=None, end=None):
+    """(traces, resolution) for `ticker` between `start` and `end` (dates, default: the whole range).
+
+    At most MAX_CHART_POINTS candles are sent; a narrow zoom window gets full-resolution bars.
+    Rolling-sentiment/correlation overlays come from the full history, so a zoom window
+    shows the same values as the overview.
+    """
+    def build():
+        bars = with_overlays(data.bars(ticker, start, end), analytics.ticker(data, ticker))
+        bars, resolution = downsample_bars(bars)
+        return chart_traces(bars), resolution
+    return figure_cache.get((ticker, data.version, start, end), build)
+
+# Built per page load, so a reload picks up the current tickers and data
+def serve_layout():
+    data = refresher.current
+
+    # Get unique tickers from the stock data
+    available_tickers = data.tickers()
+
+    # Dropdown options based on available stock tickers
+    tickers_options = [{'label': t, 'value': t} for t in available_tickers]
+    default_ticker = available_tickers[0] if available_tickers else None
+    if default_ticker is None:
+        figure = go.Figure(layout={'title': 'Loading data… refresh the page in a moment'})
+    else:
+        traces, resolution = ticker_traces(data, default_ticker)
+        figure = build_figure(default_ticker, traces, resolution, height=800)
+
+    # Cross-ticker ranking from each ticker's latest bar (not available in pushdown mode)
+    ranking = analytics.ranking(data)
+    ranking_rows = [] if ranking is None else ranking.astype({'Date': str}).to_dict('records')
+    ranking_columns = [] if ranking is None else [{'name': c, 'id': c} for c in ranking.columns]
+
+    return html.Div([
+        html.H2("Stock Price with News Sentiment"),
+        
+        html.Div([
+            html.Label("Select Ticker:"),
+            dcc.Dropdown(
+                id='ticker-filter',
+                options=tickers_options,
+                value=default_ticker,  # default selection
+                clearable=False
+            )
+        ], style={'width': '200px', 'margin-bottom': '20px'}),
+        
+        # Full figure is sent once; ticker changes only patch the trace data
+        dcc.Graph(id='candlestick-chart', figure=figure),
+        html.H4("Sentiment Ranking"),
+        dash_table.DataTable(
+            id='ranking-table',
+            columns=ranking_columns,
+            data=ranking_rows,
+            sort_action='native',
+            page_size=15,
+            style_table={'overflowX': 'auto'},
+        ),
+        html.H4("News Details"),
+        html.Div([
+            dcc.Dropdown(
+                id='news-sentiment-filter',
+                options=[{'label': s.title(), 'value': s} for s in ('positive', 'neutral', 'negative')],
+                placeholder="All sentiments",
+                style={'width': '200px', 'margin-bottom': '10px'}
+            ),
+            html.Div(id='news-message'),
+            dash_news_table('news-datatable')
+        ], id='news-table')
+    ])
+
+app.layout = serve_layout
 
 # --- Callback to update chart based on selected ticker ---
 @app.callback(
     Output('candlestick-chart', 'figure'),
-    Input('ticker-filter', 'value')
+    [Input('ticker-filter', 'value'),
+     Input('candlestick-chart', 'relayoutData')],
+    prevent_initial_call=True
 )
-def update_chart(selected_ticker):
-    df_stock_ticker = merged[merged['symbol'] == selected_ticker]
-    
-    fig = go.Figure(data=[go.Candlestick(
-        x=df_stock_ticker['ts'],
-        open=df_stock_ticker['open'],
-        high=df_stock_ticker['high'],
-        low=df_stock_ticker['low'],
-        close=df_stock_ticker['close'],
-        name='Price'
-    )])
-    
-    # Filter sentiment for selected ticker
-    daily_sentiment_ticker = df_stock_ticker[['ts','close','sentiment_score','news_count']]
-    
-    # Add sentiment markers
-    fig.add_trace(go.Scatter(
-        x=daily_sentiment_ticker['ts'],
-        y=daily_sentiment_ticker['close'] + 2,
-        mode='markers',
-        marker=dict(
-            size=10,
-            color=['green' if s > 0 else 'red' if s < 0 else 'gray' 
-                   for s in daily_sentiment_ticker['sentiment_score']],
-            symbol='diamond'
-        ),
-        hovertext=[
-            f"Sentiment Score: {s}<br>News Count: {c}"
-            for s, c in zip(daily_sentiment_ticker['sentiment_score'], daily_sentiment_ticker['news_count'])
-        ],
-        name='News Sentiment'
-    ))
-    
-    fig.update_layout(
-        title=f'{selected_ticker} Daily Price with Sentiment',
-        xaxis_title='Date',
-        yaxis_title='Price',
-        xaxis_rangeslider_visible=False,
-        hovermode='x unified',
-        height=800
-    )
-    
-    return fig
+@timed("dash_callback_seconds", callback="update_chart")
+def update_chart(selected_ticker, relayout_data):
+    # Zoom/pan → re-fetch the visible window at full resolution; double-click → back to the overview
+    window = (None, None)
+    if ctx.triggered_id == 'candlestick-chart':
+        window = zoom_window(relayout_data)
+        if window is False:   # relayout that does not move the x axis (drag mode, y zoom, ...)
+            raise PreventUpdate
+
+    # Read the snapshot reference once so the whole callback sees one version
+    data = refresher.current
+    traces, resolution = ticker_traces(data, selected_ticker, *window)
+    patch = figure_patch(selected_ticker, traces, resolution)
+    if ctx.triggered_id != 'candlestick-chart':
+        patch['layout']['xaxis']['autorange'] = True   # a new ticker starts zoomed out
+        patch['layout']['yaxis']['autorange'] = True
+    return patch
 
 # --- Callback to display news table on marker click ---
+# Only one page of rows is sent; paging, sorting and the sentiment filter re-query this callback
 @app.callback(
-    Output('news-table', 'children'),
+    [Output('news-message', 'children'),
+     Output('news-datatable', 'data'),
+     Output('news-datatable', 'page_count'),
+     Output('news-datatable', 'page_current')],
     [Input('candlestick-chart', 'clickData'),
-     Input('ticker-filter', 'value')]
+     Input('ticker-filter', 'value'),
+     Input('news-sentiment-filter', 'value'),
+     Input('news-datatable', 'page_current'),
+     Input('news-datatable', 'page_size'),
+     Input('news-datatable', 'sort_by')]
 )
-def display_news(clickData, selected_ticker):
+@timed("dash_callback_seconds", callback="display_news")
+def display_news(clickData, selected_ticker, sentiment, page_current, page_size, sort_by):
     if clickData is None:
-        return "Click on a marker to see news details for that day."
-    
-    clicked_date = pd.to_datetime(clickData['points'][0]['x']).date()
-    
-    day_news = news_expanded[
-        (news_expanded['date'] == clicked_date) &
-        (news_expanded['ticker'] == selected_ticker)
-    ]
+        return "Click on a marker to see news details for that day.", [], 1, 0
     
+    # A resampled candle/marker covers several days: customdata holds its first and last bar's day
+    point = clickData['points'][0]
+    start, end = (pd.to_datetime(d).date() for d in point.get('customdata') or [point['x']] * 2)
+    period = f"on {start}" if start == end else f"from {start} to {end}"
+
+    day_news = refresher.current.news(selected_ticker, start, end)
+
     if day_news.empty:
-        return f"No news found for {selected_ticker} on {clicked_date}"
-    
-    # Create a styled table
-    table = html.Table([
-        html.Tr([html.Th("Ticker"), html.Th("Headline"), html.Th("Sentiment"), html.Th("Link")])] +
-        [
-            html.Tr([
-                html.Td(row['ticker']),
-                html.Td(row['title']),
-                html.Td(row['sentiment'], style={'color': 'green' if row['sentiment']=='positive' else 'red' if row['sentiment']=='negative' else 'gray'}),
-                html.Td(html.A("Link", href=row.get('article_url', '#'), target="_blank"))
-            ]) for _, row in day_news.iterrows()
-        ],
-        style={'width': '100%', 'border': '1px solid black', 'border-collapse': 'collapse'}
+        return f"No news found for {selected_ticker} {period}", [], 1, 0
+
+    # A new day, ticker or filter starts again at the first page
+    if ctx.triggered_id != 'news-datatable':
+        page_current = 0
+    sort = sort_by[0] if sort_by else {}
+    page_df, page_count = news_page(
+        day_news, page_current or 0, page_size, sentiment=sentiment,
+        sort_by=sort.get('column_id'), ascending=sort.get('direction') != 'desc'
     )
-    
-    return table
+    message = f"{len(day_news)} news items for {selected_ticker} {period}"
+    return message, dash_records(page_df), page_count, min(page_current or 0, page_count - 1)
 
 # --- Run the Dash app ---
 if __name__ == "__main__":
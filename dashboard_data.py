@@ -0,0 +1,450 @@
+import os
+import glob
+import time
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, time as dtime, timedelta, timezone
+import pandas as pd
+
+from metrics import inc, timed
+from preprocessing import NEWS_ARTICLE_COLUMNS, NewsStore
+
+# google-cloud-bigquery / duckdb are imported lazily by the backend (≈1 s), so the dashboards can start serving first
+
+# -----------------------------
+# Config
+# -----------------------------
+# Compact, server-side aggregated sources maintained by create_dataset_tables.py
+PRICE_SENTIMENT_VIEW = "price_sentiment"
+NEWS_INSIGHTS_VIEW = "news_insights"
+
+# Tables behind the views: their last-modified times version the local snapshot
+SOURCE_TABLES = ["stock_daily", "daily_sentiment", "stock_news"]
+CACHE_DIR = os.environ.get("DASHBOARD_CACHE_DIR", os.path.join(".cache", "dashboard"))
+
+# "snapshot" = load every ticker once (cached locally), "pushdown" = query per ticker/date range on demand
+DATA_MODE = os.environ.get("DASHBOARD_DATA_MODE", "snapshot")
+RANGE_DAYS = int(os.environ.get("DASHBOARD_RANGE_DAYS", 365))    # default visible window in pushdown mode
+QUERY_CACHE_SIZE = int(os.environ.get("DASHBOARD_QUERY_CACHE_SIZE", 256))
+REFRESH_SECONDS = int(os.environ.get("DASHBOARD_REFRESH_SECONDS", 3600))  # 0 = load once, never refresh
+
+# Shared mode (gunicorn): one loader publishes memory-mapped Arrow IPC files here, workers map them
+SHARED_DIR = os.environ.get("DASHBOARD_SHARED_DIR")
+SHARED_POLL_SECONDS = int(os.environ.get("DASHBOARD_SHARED_POLL_SECONDS", 30))
+
+# -----------------------------
+# Dashboard data
+# -----------------------------
+@timed("preprocess_seconds", stage="load_dashboard_data")
+def load_dashboard_data(backend):
+    """Return (merged, news) read from the pre-aggregated views instead of the raw tables.
+
+    `merged` has one row per bar with sentiment_score/news_count already joined. The
+    news_insights view returns one row per (article, insight) with no nested records to
+    download; it is kept in memory as a NewsStore (article text once per article).
+
+    Both are read as Arrow record batches (BigQuery Storage Read API) into Arrow-backed
+    columns: timestamps and strings are never converted to NumPy/Python objects.
+    """
+    merged = backend.query(f"""
+        SELECT * FROM {backend.table(PRICE_SENTIMENT_VIEW)}
+    """, arrow=True)
+
+    news_rows = backend.query(f"""
+        SELECT * FROM {backend.table(NEWS_INSIGHTS_VIEW)}
+    """, arrow=True)
+
+    merged['date'] = merged['ts'].dt.date   # date32[pyarrow]
+    news = NewsStore.from_rows(news_rows)
+    print(f"✅ News insights: {len(news):,} rows for {len(news.articles):,} articles, "
+          f"{news_rows.memory_usage(deep=True).sum() / 1e6:.1f} MB as rows → {news.memory_usage() / 1e6:.1f} MB normalized")
+    return merged, news
+
+# -----------------------------
+# Local Parquet snapshot cache
+# -----------------------------
+def source_version(backend):
+    """Latest last-modified time across the source tables, as epoch ms (no bytes scanned)."""
+    return backend.modified_version(SOURCE_TABLES)
+
+def _snapshot_paths(cache_dir, version):
+    return (os.path.join(cache_dir, f"merged_{version}.parquet"),
+            os.path.join(cache_dir, f"news_articles_{version}.parquet"),
+            os.path.join(cache_dir, f"news_insights_{version}.parquet"))
+
+def _read_snapshot(paths):
+    merged_path, articles_path, insights_path = paths
+    # Arrow-backed like a fresh load (insights are converted to categoricals by NewsStore)
+    return (pd.read_parquet(merged_path, dtype_backend="pyarrow"),
+            NewsStore(pd.read_parquet(articles_path, dtype_backend="pyarrow"), pd.read_parquet(insights_path)))
+
+def _latest_snapshot_version(cache_dir):
+    versions = [int(os.path.basename(p)[len("merged_"):-len(".parquet")])
+                for p in glob.glob(os.path.join(cache_dir, "merged_*.parquet"))]
+    versions = [v for v in versions if all(os.path.exists(p) for p in _snapshot_paths(cache_dir, v))]
+    return max(versions) if versions else None
+
+def _write_atomic(df, path):
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)   # readers only ever see a complete file
+
+def load_cached_dashboard_data(backend, cache_dir=CACHE_DIR):
+    """load_dashboard_data() behind an on-disk Parquet snapshot keyed by source-table modification time.
+
+    Returns (merged, news, version).
+
+    A restart only re-queries the backend when a source table changed since the snapshot was
+    written. If the metadata check itself fails, the newest snapshot on disk is served.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    try:
+        version = source_version(backend)
+    except backend.errors as e:
+        version = _latest_snapshot_version(cache_dir)
+        if version is None:
+            raise
+        print(f"⚠️ Could not revalidate snapshot ({e}); serving cached version {version}")
+
+    paths = _snapshot_paths(cache_dir, version)
+    if all(os.path.exists(p) for p in paths):
+        print(f"✅ Loaded dashboard snapshot {version} from {cache_dir}")
+        return (*_read_snapshot(paths), version)
+
+    merged, news = load_dashboard_data(backend)
+    for df, path in zip((merged, news.articles, news.insights), paths):
+        _write_atomic(df, path)
+    print(f"✅ Wrote dashboard snapshot {version} to {cache_dir}")
+
+    # Keep only the current snapshot
+    for path in glob.glob(os.path.join(cache_dir, "*.parquet")):
+        if path not in paths:
+            os.remove(path)
+
+    return merged, news, version
+
+# -----------------------------
+# Data sources used by the dashboards
+# -----------------------------
+# Both sources expose the same interface: tickers(), bars(ticker, start, end), news(ticker, day, end).
+
+class DashboardSnapshot:
+    """Every ticker loaded up front (see load_cached_dashboard_data).
+
+    Bars and news insights are sorted once and indexed by ticker and (ticker, date) into row
+    slices, so callbacks do a dict lookup plus a positional slice instead of scanning every row.
+    News is a NewsStore: article text is joined only for the day a callback asks for.
+    """
+
+    @timed("preprocess_seconds", stage="index_snapshot")
+    def __init__(self, merged, news_store, version=None, presorted=False):
+        self.version = version
+        if not presorted:   # presorted frames (e.g. memory-mapped) are used as-is, without a copy
+            merged = merged.sort_values(['symbol', 'ts'], kind='stable', ignore_index=True)
+            news_store = news_store.sorted()
+        self.merged = merged
+        self.news_store = news_store
+        self._bar_slices = _row_slices(self.merged, 'symbol')
+        self._news_slices = _row_slices(self.news_store.insights, ['ticker', 'date'])
+        self._news_ticker_slices = _row_slices(self.news_store.insights, 'ticker')
+        self._tickers = list(self._bar_slices)
+
+    def tickers(self):
+        return self._tickers
+
+    def bars(self, ticker, start=None, end=None):
+        rows = self._bar_slices.get(ticker, slice(0, 0))
+        if start is not None or end is not None:
+            # Rows of one ticker are sorted by ts, so the date bounds are a binary search
+            dates = self.merged['date'].iloc[rows].to_numpy()
+            lo = dates.searchsorted(start, side='left') if start is not None else 0
+            hi = dates.searchsorted(end, side='right') if end is not None else len(dates)
+            rows = slice(rows.start + lo, rows.start + hi)
+        return self.merged.iloc[rows]
+
+    def news(self, ticker, day, end=None):
+        """News insights for `ticker` on `day`, or from `day` through `end` (a resampled chart bucket)."""
+        if end is None or end == day:
+            return self.news_store.rows(self._news_slices.get((ticker, day), slice(0, 0)))
+        # Insights of one ticker are sorted by date, so the day bounds are a binary search
+        rows = self._news_ticker_slices.get(ticker, slice(0, 0))
+        dates = self.news_store.insights['date'].iloc[rows].to_numpy()
+        lo, hi = dates.searchsorted(day, side='left'), dates.searchsorted(end, side='right')
+        return self.news_store.rows(slice(rows.start + lo, rows.start + hi))
+
+def _row_slices(df, keys):
+    """{key: slice} for a frame already sorted by `keys` (each group is a contiguous run of rows)."""
+    return {key: slice(positions[0], positions[-1] + 1)
+            for key, positions in df.groupby(keys, sort=False, observed=True).indices.items()}
+
+def load_local_snapshot(cache_dir=CACHE_DIR):
+    """Newest snapshot already on disk, without contacting the backend (None if there is none)."""
+    version = _latest_snapshot_version(cache_dir) if os.path.isdir(cache_dir) else None
+    if version is None:
+        return None
+    return DashboardSnapshot(*_read_snapshot(_snapshot_paths(cache_dir, version)), version)
+
+def warming_snapshot():
+    """Empty placeholder served until the first load finishes."""
+    merged = pd.DataFrame(columns=['symbol', 'ts', 'date', 'open', 'high', 'low', 'close', 'sentiment_score', 'news_count'])
+    articles = pd.DataFrame(columns=NEWS_ARTICLE_COLUMNS)
+    insights = pd.DataFrame(columns=['article', 'ticker', 'sentiment', 'date'])
+    return DashboardSnapshot(merged, NewsStore(articles, insights))
+
+def open_dashboard_data(backend, mode=DATA_MODE):
+    """Data source for the dashboards: a full local snapshot, or per-request pushdown queries."""
+    if mode == "pushdown":
+        return TickerQueryLayer(backend)
+    return DashboardSnapshot(*load_cached_dashboard_data(backend))
+
+# -----------------------------
+# Predicate/projection pushdown query layer
+# -----------------------------
+class TickerQueryLayer:
+    """Per-request queries for one ticker and date range, hitting ts/date partitions and symbol/ticker clustering.
+
+    Only the columns the chart and news table use are selected. Results are LRU-cached per
+    (query, ticker, range), and bytes processed / latency are recorded for every request.
+    """
+
+    def __init__(self, backend, max_entries=QUERY_CACHE_SIZE):
+        self.version = time.time()   # results are cached per query key; a new layer = a new version
+        self.backend = backend
+        self.max_entries = max_entries
+        self.stats = deque(maxlen=1000)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def tickers(self):
+        sql = f"""
+            SELECT DISTINCT symbol FROM {self.backend.table("stock_daily")} ORDER BY symbol
+        """
+        return self._run("tickers", (), sql, {})["symbol"].tolist()
+
+    def bars(self, ticker, start=None, end=None):
+        """Bars with sentiment for `ticker` between `start` and `end` (dates, default: last RANGE_DAYS)."""
+        end = end or datetime.now(timezone.utc).date()
+        start = start or end - timedelta(days=RANGE_DAYS)
+        sql = f"""
+            SELECT
+                d.ts, d.open, d.high, d.low, d.close,
+                COALESCE(s.sentiment_score, 0) AS sentiment_score,
+                COALESCE(s.news_count, 0) AS news_count
+            FROM {self.backend.table("stock_daily")} d
+            LEFT JOIN (
+                SELECT date, sentiment_score, news_count
+                FROM {self.backend.table("daily_sentiment")}
+                WHERE ticker = @ticker AND date BETWEEN @start_date AND @end_date
+            ) s ON s.date = CAST(d.ts AS DATE)
+            WHERE d.symbol = @ticker
+              AND d.ts >= @start_ts AND d.ts < @end_ts
+            ORDER BY d.ts
+        """
+        params = {
+            "ticker": ticker,
+            "start_date": start,
+            "end_date": end,
+            "start_ts": _day_start(start),
+            "end_ts": _day_start(end + timedelta(days=1)),
+        }
+        df = self._run("bars", (ticker, start, end), sql, params)
+        df['ts'] = pd.to_datetime(df['ts'])
+        df['date'] = df['ts'].dt.date
+        df['symbol'] = ticker
+        return df
+
+    def news(self, ticker, day, end=None):
+        """News insights for `ticker` published on `day` (UTC), or from `day` through `end`;
+        scans only those stock_news partitions."""
+        sql = f"""
+            SELECT title, article_url, published_utc, ticker, sentiment
+            FROM {self.backend.table(NEWS_INSIGHTS_VIEW)}
+            WHERE published_utc >= @start_ts AND published_utc < @end_ts
+              AND ticker = @ticker
+        """
+        params = {
+            "ticker": ticker,
+            "start_ts": _day_start(day),
+            "end_ts": _day_start((end or day) + timedelta(days=1)),
+        }
+        df = self._run("news", (ticker, day, end), sql, params)
+        df['date'] = pd.to_datetime(df['published_utc'], utc=True).dt.date if end else day
+        return df
+
+    def _run(self, name, key, sql, params):
+        cache_key = (name,) + tuple(key)
+        with self._lock:
+            if cache_key in self._cache:
+                inc("cache_requests_total", cache="query", result="hit")
+                self._cache.move_to_end(cache_key)
+                self.stats.append({"query": name, "key": key, "cached": True, "bytes_processed": 0, "seconds": 0.0})
+                return self._cache[cache_key].copy()
+
+        inc("cache_requests_total", cache="query", result="miss")
+        start = time.perf_counter()
+        df, bytes_processed = self.backend.run_query(sql, params)
+        elapsed = time.perf_counter() - start
+
+        stat = {"query": name, "key": key, "cached": False,
+                "bytes_processed": bytes_processed, "seconds": elapsed}
+        self.stats.append(stat)
+        print(f"🔎 {name}{key}: {len(df)} rows, {stat['bytes_processed'] / 1e6:.2f} MB scanned, {elapsed * 1000:.0f} ms")
+
+        with self._lock:
+            self._cache[cache_key] = df
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return df.copy()
+
+def _day_start(day):
+    return datetime.combine(day, dtime.min, tzinfo=timezone.utc)
+
+# -----------------------------
+# Shared memory-mapped snapshot (one copy for all gunicorn workers)
+# -----------------------------
+SHARED_FRAMES = ("merged", "news_articles", "news_insights")
+
+def publish_shared_snapshot(snapshot, directory=SHARED_DIR):
+    """Write a DashboardSnapshot's sorted frames (bars, news articles and insights) as uncompressed
+    Arrow IPC files and point CURRENT at them.
+
+    Files are immutable once written: each version gets new names and CURRENT is replaced
+    atomically, so workers mapping the previous version keep a valid mapping.
+    """
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    os.makedirs(directory, exist_ok=True)
+    version = snapshot.version or int(time.time() * 1000)
+    if published_version(directory) == version:
+        # Rewriting the same names would leave workers mapping the unlinked old files: two copies
+        print(f"✅ Shared snapshot {version} already published to {directory}")
+        return version
+    frames = (("merged", snapshot.merged), ("news_articles", snapshot.news_store.articles),
+              ("news_insights", snapshot.news_store.insights))
+    for name, df in frames:
+        path = os.path.join(directory, f"{name}_{version}.arrow")
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        feather.write_feather(pa.Table.from_pandas(df, preserve_index=False), tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+
+    pointer = os.path.join(directory, "CURRENT")
+    with open(f"{pointer}.tmp{os.getpid()}", "w") as f:
+        f.write(str(version))
+    os.replace(f"{pointer}.tmp{os.getpid()}", pointer)
+    print(f"✅ Published shared snapshot {version} to {directory}")
+
+    # Keep the previous version too, for workers that read CURRENT just before the swap
+    versions = sorted({int(p.rsplit("_", 1)[1][:-len(".arrow")])
+                       for p in glob.glob(os.path.join(directory, "merged_*.arrow"))})
+    for old in versions[:-2]:
+        for name in SHARED_FRAMES:
+            path = os.path.join(directory, f"{name}_{old}.arrow")
+            if os.path.exists(path):
+                os.remove(path)
+    return version
+
+def published_version(directory=SHARED_DIR):
+    """Version named by CURRENT, or None if nothing has been published yet."""
+    pointer = os.path.join(directory, "CURRENT")
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer) as f:
+        return int(f.read().strip())
+
+def open_shared_snapshot(directory=SHARED_DIR, current=None):
+    """Memory-map the published snapshot zero-copy (Arrow-backed pandas columns, no deserialization).
+
+    Returns `current` unchanged if it already is the published version, and None if nothing
+    has been published yet.
+    """
+    import pyarrow as pa
+
+    version = published_version(directory)
+    if version is None:
+        return current
+    if current is not None and current.version == version:
+        return current
+
+    tables = {name: pa.ipc.open_file(pa.memory_map(os.path.join(directory, f"{name}_{version}.arrow"))).read_all()
+              for name in SHARED_FRAMES}
+    # Insights are small integer/dictionary columns: decoded to pandas categoricals rather than mapped
+    news = NewsStore(tables["news_articles"].to_pandas(types_mapper=pd.ArrowDtype), tables["news_insights"].to_pandas())
+    return DashboardSnapshot(tables["merged"].to_pandas(types_mapper=pd.ArrowDtype), news,
+                             version=version, presorted=True)
+
+# -----------------------------
+# Background refresh with atomic swap
+# -----------------------------
+class SnapshotRefresher:
+    """Serves `current` immediately and rebuilds it with `load()` on a daemon thread every `interval` seconds.
+
+    Each load builds a complete new data source and then replaces the single `current`
+    reference (an atomic assignment), so a callback that reads `current` once always sees
+    one consistent snapshot, never a half-built frame.
+    """
+
+    def __init__(self, load, initial, interval=REFRESH_SECONDS):
+        self.load = load
+        self.current = initial
+        self.interval = interval
+        self.ready = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="dashboard-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+    def refresh(self):
+        start = time.perf_counter()
+        previous = self.current
+        self.current = self.load()
+        self.ready.set()
+        if self.current is not previous:
+            print(f"✅ Dashboard data refreshed in {time.perf_counter() - start:.1f}s (version {self.current.version})")
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:   # keep serving the previous snapshot
+                print(f"❌ Dashboard refresh failed: {e}")
+            if self.interval <= 0 and self.ready.is_set():
+                return
+            # Retry a failed first load soon instead of waiting a full interval
+            time.sleep(self.interval if self.ready.is_set() and self.interval > 0 else 30)
+
+# -----------------------------
+# Main: publish the shared snapshot (run once, or on a schedule, next to the gunicorn workers)
+# -----------------------------
+def publish_forever(directory=SHARED_DIR, interval=REFRESH_SECONDS):
+    """Republish every `interval` seconds when a source table changed; workers keep serving the
+    last version if a publish fails."""
+    from storage import get_backend
+
+    while True:
+        try:
+            backend = get_backend()
+            if source_version(backend) != published_version(directory):   # metadata only, no bytes scanned
+                publish_shared_snapshot(DashboardSnapshot(*load_cached_dashboard_data(backend)), directory)
+        except Exception as e:
+            print(f"❌ Shared snapshot publish failed: {e}")
+        time.sleep(interval if interval > 0 else 3600)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Publish the dashboard data as a shared memory-mapped snapshot")
+    parser.add_argument("--forever", action="store_true",
+                        help="Republish every DASHBOARD_REFRESH_SECONDS (what gunicorn.conf.py runs)")
+    args = parser.parse_args()
+    directory = SHARED_DIR or os.path.join(".cache", "shared")
+
+    if args.forever:
+        publish_forever(directory)
+    else:
+        from storage import get_backend
+
+        publish_shared_snapshot(DashboardSnapshot(*load_cached_dashboard_data(get_backend())), directory)
@@ -1,73 +1,129 @@
 import os
-import requests
+import time
+import argparse
 import pandas as pd
-from datetime import datetime, timedelta
-from google.cloud import bigquery
+from storage import get_backend
+from metrics import configure_logging, log_event, log_run_summary
+from polygon_client import PolygonClient, closed_window, error_payload, raise_for_payload
 
 # -----------------------------
 # Config
 # -----------------------------
-PROJECT_ID = "project-portfolio-473015"      # 🔹 replace with your GCP project
-DATASET = "stock_data_append"
-TABLE = f"{PROJECT_ID}.{DATASET}.stock_news"
+TABLE = "stock_news"
 
 SYMBOL = "NFLX"
-POLYGON_API_KEY = "s_po7wmfS3zeKBzcL0D2wdkv2H7Z6RSG"  # 🔹 replace for testing
+DEFAULT_START_DATE = "2025-07-25"   # first day fetched for a symbol with no articles yet
+
+PAGE_LIMIT = 1000                                             # Polygon max per page
+CHUNK_SIZE = int(os.environ.get("NEWS_CHUNK_SIZE", 5000))     # rows per load
+
+NEWS_COLUMNS = [
+    "id", "title", "author", "description", "article_url", "amp_url", "image_url",
+    "published_utc", "publisher", "tickers", "keywords", "insights",
+]
+PUBLISHER_FIELDS = ["name", "homepage_url", "logo_url", "favicon_url"]
+
+# "merge" = upsert on id through a staging table, "append" = plain append
+LOAD_MODE = os.environ.get("BQ_LOAD_MODE", "merge")
+MERGE_KEYS = ["id"]
 
 # -----------------------------
-# BigQuery Client
+# Incremental watermark
 # -----------------------------
-bq_client = bigquery.Client(project=PROJECT_ID)
+def get_watermark(symbol=SYMBOL):
+    """Latest published_utc already stored for an article mentioning `symbol` (None if no rows yet)."""
+    return get_backend().news_watermark(symbol)
 
 # -----------------------------
-# Fetch stock news
+# Fetch stock news (page by page)
 # -----------------------------
-def fetch_stock_news():
-    start_date = datetime(2025, 7, 25).strftime("%Y-%m-%d")
-    end_date = datetime(2025, 9, 24).strftime("%Y-%m-%d")
+def iter_news_pages(symbol=SYMBOL, start_date=DEFAULT_START_DATE, end_date=None, client=None, published_after=None):
+    """Yield one list of raw articles per Polygon page, following `next_url` until exhausted.
+
+    `published_after` (a watermark timestamp) replaces `start_date` with an exclusive lower bound.
+    Pages of a range that ended before today come from the response cache when fetched before.
+    An error response raises polygon_client.PolygonError (a requests.RequestException).
+    """
+    if published_after is not None:
+        lower = f"published_utc.gt={published_after.strftime('%Y-%m-%dT%H:%M:%SZ')}"
+    else:
+        lower = f"published_utc.gte={start_date}"
+    upper = f"&published_utc.lte={end_date}" if end_date else ""
 
     url = (
         f"https://api.polygon.io/v2/reference/news"
-        f"?ticker={SYMBOL}&published_utc.gte={start_date}"
-        f"&published_utc.lte={end_date}&limit=1000&apiKey={POLYGON_API_KEY}"
+        f"?ticker={symbol}&{lower}{upper}"
+        f"&limit={PAGE_LIMIT}"
     )
-    resp = requests.get(url).json()
+    client = client or PolygonClient()
+    cacheable = closed_window(end_date)
+    page = 0
+    while url:
+        resp, status = client.get_json(url, endpoint="news", cacheable=cacheable)
 
-    if "results" not in resp:
-        print("❌ API error:", resp)
-        return pd.DataFrame()
+        if error_payload(resp, status):
+            print("❌ API error:", resp)
+            log_event("polygon_error", symbol=symbol, endpoint="news", status=status)
+            raise_for_payload(resp, status, url)   # also mid-pagination: the range is incomplete
+        articles = resp.get("results", [])
+
+        page += 1
+        print(f"✅ Fetched page {page}: {len(articles)} articles for {symbol}")
+        log_event("polygon_fetch", symbol=symbol, endpoint="news", page=page, rows=len(articles))
+        yield articles
+
+        # next_url carries the cursor but not the API key; the client adds it
+        url = resp.get("next_url")
+
+def normalize_news_page(articles):
+    """Turn one page of articles into column lists matching the stock_news schema."""
+    publishers = [a.get("publisher") or {} for a in articles]
+    return {
+        "id": [a.get("id") for a in articles],
+        "title": [a.get("title") for a in articles],
+        "author": [a.get("author") for a in articles],
+        "description": [a.get("description") for a in articles],
+        "article_url": [a.get("article_url") for a in articles],
+        "amp_url": [a.get("amp_url") for a in articles],
+        "image_url": [a.get("image_url") for a in articles],
+        "published_utc": [a.get("published_utc") for a in articles],
+        "publisher": [{f: p.get(f) for f in PUBLISHER_FIELDS} for p in publishers],
+        "tickers": [a.get("tickers", []) for a in articles],
+        "keywords": [a.get("keywords", []) for a in articles],
+        "insights": [a.get("insights", []) for a in articles],
+    }
+
+def iter_news_chunks(pages, chunk_size=CHUNK_SIZE):
+    """Re-slice normalized pages into DataFrames of exactly `chunk_size` rows (last one may be shorter)."""
+    buffer = {c: [] for c in NEWS_COLUMNS}
+    buffered = 0
+
+    for articles in pages:
+        columns = normalize_news_page(articles)
+        for c in NEWS_COLUMNS:
+            buffer[c].extend(columns[c])
+        buffered += len(articles)
 
-    articles = resp["results"]
-    print(f"✅ Fetched {len(articles)} articles for {SYMBOL}")
-
-    rows = []
-    for a in articles:
-        rows.append({
-            "id": a.get("id"),
-            "title": a.get("title"),
-            "author": a.get("author"),
-            "description": a.get("description"),
-            "article_url": a.get("article_url"),
-            "amp_url": a.get("amp_url"),
-            "image_url": a.get("image_url"),
-            "published_utc": a.get("published_utc"),
-            "publisher": {
-                "name": a.get("publisher", {}).get("name"),
-                "homepage_url": a.get("publisher", {}).get("homepage_url"),
-                "logo_url": a.get("publisher", {}).get("logo_url"),
-                "favicon_url": a.get("publisher", {}).get("favicon_url")
-            },
-            "tickers": a.get("tickers", []),
-            "keywords": a.get("keywords", []),
-            "insights": a.get("insights", [])
-        })
-
-    return pd.DataFrame(rows)
+        while buffered >= chunk_size:
+            yield pd.DataFrame({c: buffer[c][:chunk_size] for c in NEWS_COLUMNS})
+            buffer = {c: buffer[c][chunk_size:] for c in NEWS_COLUMNS}
+            buffered -= chunk_size
+
+    if buffered:
+        yield pd.DataFrame(buffer)
+
+def fetch_stock_news(symbol=SYMBOL, start_date=DEFAULT_START_DATE, end_date=None):
+    """Convenience wrapper returning every article in one DataFrame (use iter_news_chunks for large ranges)."""
+    chunks = list(iter_news_chunks(iter_news_pages(symbol, start_date, end_date)))
+    if not chunks:
+        return pd.DataFrame()
+    return pd.concat(chunks, ignore_index=True)
 
 # -----------------------------
-# Load into BigQuery (batch load)
+# Load into storage (BigQuery batch load or local DuckDB)
 # -----------------------------
-def load_to_bigquery(df: pd.DataFrame):
+def load_to_bigquery(df: pd.DataFrame, mode=LOAD_MODE):
+    """mode="merge" upserts on id (BigQuery: staging table + MERGE), so re-runs never duplicate articles."""
     if df.empty:
         print("⚠️ No news rows to load")
         return
@@ -75,15 +131,59 @@ def load_to_bigquery(df: pd.DataFrame):
 # Convert published_utc to datetime (UTC)
     if "published_utc" in df.columns:
         df["published_utc"] = pd.to_datetime(df["published_utc"], errors="coerce", utc=True)
-        
-    job = bq_client.load_table_from_dataframe(df, TABLE)
-    job.result()  # Wait for job to finish
 
-    print(f"✅ Loaded {len(df)} news rows into {TABLE}")
+    backend = get_backend()
+    if mode != "merge":
+        affected = backend.load(TABLE, df)
+        print(f"✅ Loaded {len(df)} news rows into {TABLE}")
+    else:
+        affected = backend.upsert(TABLE, df, MERGE_KEYS)
+        print(f"✅ Merged {len(df)} news rows into {TABLE} ({affected} inserted/updated)")
+    log_event("load", table=TABLE, mode=mode, backend=backend.name, rows=len(df), affected=affected)
+
+def stream_news_to_bigquery(symbol=SYMBOL, start_date=DEFAULT_START_DATE, end_date=None,
+                            chunk_size=CHUNK_SIZE, incremental=False, mode=LOAD_MODE, refresh_sentiment=True):
+    """Follow every page and flush fixed-size chunks, so memory stays at ~one page + one chunk.
+
+    With `incremental=True` only articles published after the symbol's watermark are fetched.
+    `refresh_sentiment` re-aggregates daily_sentiment for the days the loaded articles touch.
+    """
+    published_after = get_watermark(symbol) if incremental else None
+    if published_after is not None:
+        print(f"✅ {symbol} watermark: {published_after}")
+
+    total = 0
+    earliest = None
+    with PolygonClient() as client:
+        pages = iter_news_pages(symbol, start_date, end_date, client, published_after=published_after)
+        for chunk in iter_news_chunks(pages, chunk_size):
+            load_to_bigquery(chunk, mode=mode)
+            total += len(chunk)
+            chunk_min = chunk["published_utc"].min()
+            if pd.notna(chunk_min) and (earliest is None or chunk_min < earliest):
+                earliest = chunk_min
+
+    if total == 0:
+        print("⚠️ No news rows to load")
+    elif refresh_sentiment and earliest is not None:
+        get_backend().refresh_daily_sentiment(since=earliest.date())
+    return total
 
 # -----------------------------
 # Main
 # -----------------------------
 if __name__ == "__main__":
-    df_news = fetch_stock_news()
-    load_to_bigquery(df_news)
+    parser = argparse.ArgumentParser(description="Fetch Polygon news into BigQuery")
+    parser.add_argument("symbol", nargs="?", default=SYMBOL)
+    parser.add_argument("--start", default=DEFAULT_START_DATE, help="First day to fetch (YYYY-MM-DD)")
+    parser.add_argument("--end", default=None, help="Last day to fetch (YYYY-MM-DD, default: open-ended)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only fetch articles newer than the latest published_utc in stock_news")
+    parser.add_argument("--mode", choices=["merge", "append"], default=LOAD_MODE,
+                        help="merge = upsert on id, append = plain append")
+    args = parser.parse_args()
+    configure_logging()
+    started = time.perf_counter()
+
+    stream_news_to_bigquery(args.symbol, args.start, args.end, incremental=args.incremental, mode=args.mode)
+    log_run_summary("fetch_data_news", started)
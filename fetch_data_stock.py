@@ -1,74 +1,331 @@
 import os
+import time
+import argparse
 import requests
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from datetime import datetime, timedelta
-from google.cloud import bigquery
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from storage import get_backend
+from metrics import configure_logging, log_event, log_run_summary
+from polygon_client import PolygonClient, TokenBucket, closed_window, error_payload, make_session, raise_for_payload
 
 # -----------------------------
 # Config
 # -----------------------------
-PROJECT_ID = "project-portfolio-473015"       # 🔹 replace with your project
-DATASET = "stock_data_append"
-TABLE = f"{PROJECT_ID}.{DATASET}.stock_daily"
+TABLE = "stock_daily"
 
 SYMBOL = "NFLX"
-POLYGON_API_KEY = "s_po7wmfS3zeKBzcL0D2wdkv2H7Z6RSG"  # 🔹 replace for testing
+DEFAULT_START_DATE = "2025-07-25"   # first day fetched for a symbol with no rows yet
+
+# Watchlist mode: tickers fetched together in one run
+WATCHLIST = ["NVDA", "MSFT", "AAPL", "GOOGL", "AMZN", "META", "AVGO", "TSLA", "NFLX"]
+MAX_WORKERS = int(os.environ.get("POLYGON_MAX_WORKERS", 8))
+# Polygon plan limit (free tier = 5 requests/minute, paid tiers are unlimited → set 0)
+REQUESTS_PER_MINUTE = float(os.environ.get("POLYGON_REQUESTS_PER_MINUTE", 5))
+
+# "merge" = upsert on (symbol, ts) through a staging table, "append" = plain append
+LOAD_MODE = os.environ.get("BQ_LOAD_MODE", "merge")
+MERGE_KEYS = ["symbol", "ts"]
+
+# Bar size: Polygon timespan × multiplier (e.g. 5 minute). Daily bars go to stock_daily,
+# minute/hour bars to stock_intraday, keyed by (symbol, timespan, multiplier, ts)
+TIMESPAN = os.environ.get("POLYGON_TIMESPAN", "day")
+MULTIPLIER = int(os.environ.get("POLYGON_MULTIPLIER", 1))
+INTRADAY_TABLE = "stock_intraday"
+INTRADAY_MERGE_KEYS = ["symbol", "timespan", "multiplier", "ts"]
+
+# One aggregates response holds at most RESPONSE_LIMIT base aggregates; intraday bars are built
+# from minute aggregates, ~16 h × 60 per trading day including extended hours
+RESPONSE_LIMIT = 50_000
+BASE_BARS_PER_DAY = {"minute": 16 * 60, "hour": 16 * 60, "day": 1}
+WINDOW_FILL = 0.9                                                    # headroom below the limit
+INTRADAY_CHUNK_ROWS = int(os.environ.get("INTRADAY_CHUNK_ROWS", 500_000))   # rows per load
+
+# Polygon aggregate keys → stock_daily columns
+BAR_COLUMNS = {"t": "ts", "o": "open", "h": "high", "l": "low", "c": "close",
+               "v": "volume", "vw": "vwap", "n": "trades_count"}
+RAW_BAR_SCHEMA = pa.schema([
+    ("t", pa.int64()), ("o", pa.float64()), ("h", pa.float64()), ("l", pa.float64()),
+    ("c", pa.float64()), ("v", pa.float64()), ("vw", pa.float64()), ("n", pa.int64()),
+])
+STOCK_DAILY_ARROW_SCHEMA = pa.schema([
+    ("symbol", pa.string()),
+    ("ts", pa.timestamp("us", tz="UTC")),   # BigQuery TIMESTAMP column
+    ("open", pa.float64()),
+    ("high", pa.float64()),
+    ("low", pa.float64()),
+    ("close", pa.float64()),
+    ("volume", pa.float64()),
+    ("vwap", pa.float64()),
+    ("trades_count", pa.int64()),
+])
+STOCK_INTRADAY_ARROW_SCHEMA = pa.schema(
+    [STOCK_DAILY_ARROW_SCHEMA.field("symbol"), ("timespan", pa.string()), ("multiplier", pa.int64())]
+    + [f for f in STOCK_DAILY_ARROW_SCHEMA if f.name != "symbol"]
+)
 
 # -----------------------------
-# BigQuery Client
+# Incremental watermarks
 # -----------------------------
-bq_client = bigquery.Client(project=PROJECT_ID)
+def get_watermarks(symbols, timespan="day", multiplier=1):
+    """Return {symbol: max ts already stored} for the given symbols and bar size (missing → no rows yet)."""
+    if timespan == "day":
+        return get_backend().stock_watermarks(symbols)
+    return get_backend().stock_watermarks(symbols, INTRADAY_TABLE, timespan=timespan, multiplier=multiplier)
+
+def incremental_start(watermark, default=DEFAULT_START_DATE):
+    """First day to fetch after the watermark: the watermark's own day, or `default` with no rows yet.
+
+    The last stored bar may be partial (a daily bar stored during market hours, or an intraday
+    day still in progress), so its day is fetched again; merge mode upserts the overlap away.
+    """
+    if watermark is None:
+        return default
+    return watermark.strftime("%Y-%m-%d")
+
+def bar_schema(timespan="day"):
+    return STOCK_DAILY_ARROW_SCHEMA if timespan == "day" else STOCK_INTRADAY_ARROW_SCHEMA
+
+def bar_table(timespan="day"):
+    return TABLE if timespan == "day" else INTRADAY_TABLE
 
 # ----------------------------- 
 # Fetch stock data 
 # -----------------------------
-def fetch_stock_data():
-    start_date = datetime(2025, 7, 25).strftime("%Y-%m-%d")
-    end_date = datetime(2025, 9, 29).strftime("%Y-%m-%d")
-
-    url = f"https://api.polygon.io/v2/aggs/ticker/{SYMBOL}/range/1/day/{start_date}/{end_date}?adjusted=true&sort=asc&limit=50000&apiKey={POLYGON_API_KEY}"
-    resp = requests.get(url).json()
-
-    if "results" not in resp:
-        print("❌ API error:", resp)
-        return pd.DataFrame()
-
-    results = resp["results"]
-    print(f"✅ Fetched {len(results)} rows for {SYMBOL}")
-
-    rows = []
-    for r in results:
-        ts = datetime.utcfromtimestamp(r["t"] / 1000)  # convert ms → datetime
-        rows.append({
-            "symbol": SYMBOL,
-            "ts": ts,                     # BigQuery TIMESTAMP column
-            "open": r.get("o"),
-            "high": r.get("h"),
-            "low": r.get("l"),
-            "close": r.get("c"),
-            "volume": r.get("v"),
-            "vwap": r.get("vw"),
-            "trades_count": r.get("n")
-        })
-
-    return pd.DataFrame(rows)
+def fetch_stock_data(symbol=SYMBOL, start_date=DEFAULT_START_DATE, end_date=None, client=None,
+                     timespan="day", multiplier=1):
+    """`client` is a PolygonClient (shared session, rate limiter, response cache); default: a new one.
+
+    Windows that ended before today are served from the response cache when fetched before.
+    An error response raises polygon_client.PolygonError (a requests.RequestException).
+    """
+    end_date = end_date or datetime.utcnow().strftime("%Y-%m-%d")
+    schema = bar_schema(timespan)
+    if start_date > end_date:
+        print(f"✅ {symbol} already up to date (next bar {start_date})")
+        return schema.empty_table()
+
+    client = client or PolygonClient()
+    cacheable = closed_window(end_date)
+    url = (f"https://api.polygon.io/v2/aggs/ticker/{symbol}/range/{multiplier}/{timespan}/{start_date}/{end_date}"
+           f"?adjusted=true&sort=asc&limit={RESPONSE_LIMIT}")
+    results = []
+    while url:
+        resp, status = client.get_json(url, endpoint="aggs", cacheable=cacheable)
+
+        if error_payload(resp, status):
+            print(f"❌ API error for {symbol}:", resp)
+            log_event("polygon_error", symbol=symbol, endpoint="aggs", status=status)
+            raise_for_payload(resp, status, url)   # a failed window, not an empty one
+
+        results.extend(resp.get("results", []))
+        # Only set when a window still exceeds the response limit; the client adds the API key
+        url = resp.get("next_url")
+
+    print(f"✅ Fetched {len(results)} rows for {symbol} {start_date}..{end_date}")
+    log_event("polygon_fetch", symbol=symbol, endpoint="aggs", timespan=timespan, multiplier=multiplier,
+              start=start_date, end=end_date, rows=len(results))
+
+    return normalize_bars(results, symbol, timespan, multiplier)
+
+def normalize_bars(results, symbol, timespan="day", multiplier=1):
+    """Convert Polygon aggregate results column-wise into an Arrow table with the stock_daily
+    (or, for minute/hour bars, stock_intraday) schema."""
+    raw = pa.Table.from_pylist(results, schema=RAW_BAR_SCHEMA)   # missing keys → nulls
+    columns = {BAR_COLUMNS[name]: raw.column(name) for name in raw.column_names}
+
+    # ms since epoch → TIMESTAMP in one vectorized cast
+    columns["ts"] = pc.cast(columns["ts"], pa.timestamp("ms", tz="UTC")).cast(pa.timestamp("us", tz="UTC"))
+    columns["symbol"] = pa.array([symbol] * raw.num_rows, pa.string())
+    columns["timespan"] = pa.array([timespan] * raw.num_rows, pa.string())
+    columns["multiplier"] = pa.array([multiplier] * raw.num_rows, pa.int64())
+
+    schema = bar_schema(timespan)
+    return pa.table([columns[f.name] for f in schema], schema=schema)
+
+# -----------------------------
+# Fetch a whole watchlist concurrently
+# -----------------------------
+def fetch_watchlist(symbols=WATCHLIST, start_dates=None, end_date=None,
+                    max_workers=MAX_WORKERS, requests_per_minute=REQUESTS_PER_MINUTE):
+    """`start_dates` maps symbol → first day to fetch (e.g. from get_watermarks); default DEFAULT_START_DATE."""
+    start_dates = start_dates or {}
+    limiter = TokenBucket(requests_per_minute)
+    tables = []
+
+    with PolygonClient(make_session(max_workers), limiter) as client, \
+            ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(
+                fetch_stock_data, s,
+                start_date=start_dates.get(s, DEFAULT_START_DATE), end_date=end_date, client=client,
+            ): s
+            for s in symbols
+        }
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                table = future.result()
+            except requests.RequestException as e:
+                print(f"❌ Request failed for {symbol}: {e}")
+                continue
+            if table.num_rows:
+                tables.append(table)
+
+    if not tables:
+        return STOCK_DAILY_ARROW_SCHEMA.empty_table()
+
+    table = pa.concat_tables(tables)
+    print(f"✅ Fetched {table.num_rows} rows for {len(tables)}/{len(symbols)} symbols")
+    return table
+
+# -----------------------------
+# Intraday bars: date windows under the response limit, fetched in parallel, loaded in chunks
+# -----------------------------
+def date_windows(start_date, end_date, timespan="minute"):
+    """Split [start_date, end_date] into consecutive inclusive (start, end) date strings whose
+    bars fit one aggregates response."""
+    days_per_window = max(1, int(RESPONSE_LIMIT * WINDOW_FILL // BASE_BARS_PER_DAY[timespan]))
+    start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    windows = []
+    while start <= end:
+        window_end = min(end, start + timedelta(days=days_per_window - 1))
+        windows.append((start.isoformat(), window_end.isoformat()))
+        start = window_end + timedelta(days=1)
+    return windows
+
+def fetch_intraday(symbols=WATCHLIST, start_dates=None, end_date=None, timespan="minute", multiplier=1,
+                   max_workers=MAX_WORKERS, requests_per_minute=REQUESTS_PER_MINUTE,
+                   chunk_rows=INTRADAY_CHUNK_ROWS, mode=LOAD_MODE):
+    """Fetch every (symbol, window) in parallel and load finished windows in ~`chunk_rows` batches.
+
+    Loads run on this thread while the workers keep fetching, and only 2 × `max_workers`
+    windows are in flight at a time, so about one chunk of bars is held in memory. Returns the number of rows loaded.
+    """
+    start_dates = start_dates or {}
+    end_date = end_date or datetime.utcnow().strftime("%Y-%m-%d")
+    tasks = [(s, window) for s in symbols
+             for window in date_windows(start_dates.get(s, DEFAULT_START_DATE), end_date, timespan)]
+    print(f"✅ {len(tasks)} windows of {multiplier} {timespan} bars for {len(symbols)} symbols")
+
+    limiter = TokenBucket(requests_per_minute)
+    pending, pending_rows, total = [], 0, 0
+
+    def flush():
+        nonlocal pending, pending_rows, total
+        if pending:
+            load_to_bigquery(pa.concat_tables(pending), mode=mode, timespan=timespan)
+            total += pending_rows
+            pending, pending_rows = [], 0
+
+    queue = iter(tasks)
+    with PolygonClient(make_session(max_workers), limiter) as client, \
+            ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # At most 2 × max_workers windows in flight, and each future is dropped once consumed,
+        # so fetched-but-unloaded bars never exceed about one chunk plus the windows in flight
+        in_flight = {}
+
+        def submit_next():
+            for s, (start, end) in queue:
+                in_flight[pool.submit(
+                    fetch_stock_data, s, start_date=start, end_date=end, client=client,
+                    timespan=timespan, multiplier=multiplier,
+                )] = (s, start)
+                return
+
+        for _ in range(2 * max_workers):
+            submit_next()
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                symbol, start = in_flight.pop(future)
+                submit_next()
+                try:
+                    table = future.result()
+                except requests.RequestException as e:
+                    print(f"❌ Request failed for {symbol} window {start}: {e}")
+                    continue
+                if table.num_rows:
+                    pending.append(table)
+                    pending_rows += table.num_rows
+                if pending_rows >= chunk_rows:
+                    flush()
+        flush()
+
+    print(f"✅ Loaded {total} {multiplier} {timespan} bars for {len(symbols)} symbols")
+    return total
 
 # -----------------------------
-# Load into BigQuery (batch load)
+# Load into storage (BigQuery batch load or local DuckDB)
 # -----------------------------
-def load_to_bigquery(df: pd.DataFrame):
-    if df.empty:
+def load_to_bigquery(table, mode=LOAD_MODE, timespan="day"):
+    """Load an Arrow table (or DataFrame) of bars into the configured storage backend (STORAGE_BACKEND).
+
+    mode="merge" upserts on (symbol, ts) (BigQuery: staging table + MERGE), so re-runs never duplicate bars.
+    Minute/hour bars go to stock_intraday, upserted on (symbol, timespan, multiplier, ts).
+    """
+    if isinstance(table, pd.DataFrame):
+        table = pa.Table.from_pandas(table, schema=bar_schema(timespan), preserve_index=False)
+
+    if table.num_rows == 0:
         print("⚠️ No rows to load")
         return
 
-    job = bq_client.load_table_from_dataframe(df, TABLE)
-    job.result()  # Wait for job to finish
-
-    print(f"✅ Loaded {len(df)} rows into {TABLE}")
+    backend = get_backend()
+    destination = bar_table(timespan)
+    if mode == "merge":
+        keys = MERGE_KEYS if timespan == "day" else INTRADAY_MERGE_KEYS
+        affected = backend.upsert(destination, table, keys)
+        print(f"✅ Merged {table.num_rows} rows into {destination} ({affected} inserted/updated)")
+    else:
+        affected = backend.load(destination, table)
+        print(f"✅ Loaded {table.num_rows} rows into {destination}")
+    log_event("load", table=destination, mode=mode, backend=backend.name, rows=table.num_rows, affected=affected)
 
 # -----------------------------
 # Main
 # -----------------------------
 if __name__ == "__main__":
-    df = fetch_stock_data()
-    load_to_bigquery(df)
+    parser = argparse.ArgumentParser(description="Fetch Polygon daily or intraday bars into storage")
+    parser.add_argument("symbols", nargs="*", help=f"Tickers to fetch (default: {SYMBOL})")
+    parser.add_argument("--watchlist", action="store_true", help="Fetch every ticker in WATCHLIST")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--rpm", type=float, default=REQUESTS_PER_MINUTE, help="Polygon requests per minute (0 = unlimited)")
+    parser.add_argument("--start", default=DEFAULT_START_DATE, help="First day to fetch (YYYY-MM-DD)")
+    parser.add_argument("--end", default=None, help="Last day to fetch (YYYY-MM-DD, default: today)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Start each symbol at the day of its latest stored bar (--start if it has none)")
+    parser.add_argument("--mode", choices=["merge", "append"], default=LOAD_MODE,
+                        help="merge = upsert on (symbol, ts), append = plain append")
+    parser.add_argument("--timespan", choices=["minute", "hour", "day"], default=TIMESPAN,
+                        help="Bar timespan; minute/hour bars go to stock_intraday")
+    parser.add_argument("--multiplier", type=int, default=MULTIPLIER, help="Bar size in timespans (e.g. 5 → 5-minute bars)")
+    parser.add_argument("--chunk-rows", type=int, default=INTRADAY_CHUNK_ROWS, help="Intraday rows per load")
+    args = parser.parse_args()
+    configure_logging()
+    started = time.perf_counter()
+
+    symbols = WATCHLIST if args.watchlist else (args.symbols or [SYMBOL])
+    if args.incremental:
+        watermarks = get_watermarks(symbols, args.timespan, args.multiplier)
+        start_dates = {s: incremental_start(watermarks.get(s), default=args.start) for s in symbols}
+    else:
+        start_dates = {s: args.start for s in symbols}
+
+    if args.timespan != "day":
+        # Windowed, parallel and loaded chunk by chunk (a year of minute bars is ~250k rows per symbol)
+        fetch_intraday(symbols, start_dates=start_dates, end_date=args.end, timespan=args.timespan,
+                       multiplier=args.multiplier, max_workers=args.workers, requests_per_minute=args.rpm,
+                       chunk_rows=args.chunk_rows, mode=args.mode)
+    elif len(symbols) > 1:
+        # One session, one rate limiter and a single load job for the whole batch
+        df = fetch_watchlist(symbols, start_dates=start_dates, end_date=args.end,
+                             max_workers=args.workers, requests_per_minute=args.rpm)
+        load_to_bigquery(df, mode=args.mode)
+    else:
+        df = fetch_stock_data(symbols[0], start_date=start_dates[symbols[0]], end_date=args.end)
+        load_to_bigquery(df, mode=args.mode)
+    log_run_summary("fetch_data_stock", started)
@@ -0,0 +1,216 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from metrics import inc
+
+# -----------------------------
+# Candlestick + sentiment figure (shared by both dashboards)
+# -----------------------------
+CHART_LAYOUT = dict(
+    xaxis_title='Date',
+    yaxis_title='Price',
+    xaxis_rangeslider_visible=False,
+    hovermode='x unified',
+)
+
+# Upper bound on candles sent to the browser; wider ranges are resampled into coarser OHLC buckets
+MAX_CHART_POINTS = int(os.environ.get("MAX_CHART_POINTS", 500))
+
+# Candidate bucket sizes, finest first: (pandas resample rule, approximate width, label)
+BUCKET_RULES = [
+    ("1min", pd.Timedelta(minutes=1), "1-minute"),
+    ("5min", pd.Timedelta(minutes=5), "5-minute"),
+    ("15min", pd.Timedelta(minutes=15), "15-minute"),
+    ("1h", pd.Timedelta(hours=1), "hourly"),
+    ("4h", pd.Timedelta(hours=4), "4-hour"),
+    ("1D", pd.Timedelta(days=1), "daily"),
+    ("W-MON", pd.Timedelta(days=7), "weekly"),
+    ("MS", pd.Timedelta(days=31), "monthly"),
+    ("QS", pd.Timedelta(days=92), "quarterly"),
+    ("YS", pd.Timedelta(days=366), "yearly"),
+]
+
+NEWS_SPIKE_Z = 2.0
+
+def chart_title(ticker, resolution=None):
+    title = f'{ticker} Daily Price with Sentiment'
+    return f'{title} ({resolution} buckets)' if resolution else title
+
+def downsample_bars(df_ticker, max_points=MAX_CHART_POINTS):
+    """At most ~`max_points` bars: returns (bars, resolution label or None if not resampled).
+
+    Buckets take first open / max high / min low / last close, and sum sentiment_score and
+    news_count, so each sentiment marker covers the same span as its candle. Analytics overlays
+    (if present) keep the bucket's last value, and the largest news-volume z-score.
+    """
+    if len(df_ticker) <= max_points:
+        return df_ticker, None
+
+    ts = pd.DatetimeIndex(pd.to_datetime(df_ticker['ts'], utc=True))
+    span = ts[-1] - ts[0]
+    rule, resolution = BUCKET_RULES[-1][0], BUCKET_RULES[-1][2]
+    for candidate, width, label in BUCKET_RULES:
+        if span / width <= max_points:
+            rule, resolution = candidate, label
+            break
+
+    aggregations = {
+        'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last',
+        'sentiment_score': 'sum', 'news_count': 'sum',
+        'sentiment_roll': 'last', 'sentiment_return_corr': 'last', 'news_z': 'max',
+    }
+    aggregations = {col: how for col, how in aggregations.items() if col in df_ticker.columns}
+    frame = pd.DataFrame({
+        col: np.asarray(df_ticker[col].to_numpy(dtype=float, na_value=np.nan)) for col in aggregations
+    }, index=ts)
+    # First/last bar of each bucket: the days its summed sentiment and news count cover
+    frame['start_date'] = frame['end_date'] = ts.as_unit('ns').asi8
+    aggregations.update(start_date='first', end_date='last')
+    buckets = frame.resample(rule, label='left', closed='left').agg(aggregations).dropna(subset=['open'])   # buckets with no bars (weekends, holidays)
+    buckets[['sentiment_score', 'news_count']] = buckets[['sentiment_score', 'news_count']].astype('int64')
+    for col in ('start_date', 'end_date'):
+        buckets[col] = pd.to_datetime(buckets[col].astype('int64'), utc=True).dt.date
+    return buckets.rename_axis('ts').reset_index(), resolution
+
+def zoom_window(relayout_data):
+    """Visible x range from a Dash relayoutData event.
+
+    Returns (start_date, end_date) after a zoom/pan, (None, None) after an autorange reset
+    (double-click), and False for events that do not change the x axis.
+    """
+    relayout_data = relayout_data or {}
+    if relayout_data.get('xaxis.autorange'):
+        return None, None
+    bounds = relayout_data.get('xaxis.range') or [relayout_data.get('xaxis.range[0]'),
+                                                   relayout_data.get('xaxis.range[1]')]
+    if None in bounds:
+        return False
+    start, end = (pd.Timestamp(b).date() for b in bounds)
+    return start, end
+
+def chart_traces(df_ticker):
+    """Column arrays for the price and sentiment traces of one ticker (no per-row Python loops)."""
+    score = df_ticker['sentiment_score'].to_numpy()
+    hovertext = (
+        "Sentiment Score: " + df_ticker['sentiment_score'].astype(str)
+        + "<br>News Count: " + df_ticker['news_count'].astype(str)
+    )
+    # Analytics overlays (analytics.with_overlays); NaN when the data source has none
+    overlays = {col: (df_ticker[col].to_numpy(dtype=float, na_value=np.nan) if col in df_ticker.columns
+                      else np.full(len(df_ticker), np.nan))
+                for col in ('sentiment_roll', 'sentiment_return_corr', 'news_z')}
+    news_z = overlays['news_z']
+    # [first day, last day] each candle/marker covers, sent as customdata so a click opens that range's news
+    if 'start_date' in df_ticker.columns:
+        start, end = df_ticker['start_date'], df_ticker['end_date']
+    else:
+        start = end = pd.to_datetime(df_ticker['ts'], utc=True).dt.date
+    bounds = np.column_stack([start.astype(str).to_numpy(), end.astype(str).to_numpy()])
+    hovertext = hovertext + np.where(np.isnan(news_z), "", "<br>News Volume Z: " + np.round(news_z, 2).astype(str))
+    return {
+        'x': df_ticker['ts'].to_numpy(),
+        'open': df_ticker['open'].to_numpy(),
+        'high': df_ticker['high'].to_numpy(),
+        'low': df_ticker['low'].to_numpy(),
+        'close': df_ticker['close'].to_numpy(),
+        'marker_y': df_ticker['close'].to_numpy() + 2,
+        'marker_color': np.where(score > 0, 'green', np.where(score < 0, 'red', 'gray')),
+        'hovertext': hovertext.to_numpy(),
+        # News-volume spikes (z ≥ NEWS_SPIKE_Z) get larger markers
+        'marker_size': np.where(news_z >= NEWS_SPIKE_Z, 16, 10),
+        'sentiment_roll': overlays['sentiment_roll'],
+        'sentiment_return_corr': overlays['sentiment_return_corr'],
+        'bounds': bounds,
+    }
+
+def build_figure(ticker, traces, resolution=None, **layout):
+    fig = go.Figure(data=[
+        go.Candlestick(
+            x=traces['x'],
+            open=traces['open'],
+            high=traces['high'],
+            low=traces['low'],
+            close=traces['close'],
+            customdata=traces['bounds'],
+            name='Price'
+        ),
+        go.Scatter(
+            x=traces['x'],
+            y=traces['marker_y'],
+            mode='markers',
+            marker=dict(size=traces['marker_size'], color=traces['marker_color'], symbol='diamond'),
+            hovertext=traces['hovertext'],
+            customdata=traces['bounds'],
+            name='News Sentiment'
+        ),
+        go.Scatter(
+            x=traces['x'],
+            y=traces['sentiment_roll'],
+            mode='lines',
+            line=dict(color='royalblue', width=1.5),
+            yaxis='y2',
+            name='Rolling Sentiment'
+        ),
+        go.Scatter(
+            x=traces['x'],
+            y=traces['sentiment_return_corr'],
+            mode='lines',
+            line=dict(color='darkorange', width=1.5, dash='dot'),
+            yaxis='y2',
+            name='Sentiment→Return Corr'
+        ),
+    ])
+    fig.update_layout(title=chart_title(ticker, resolution), **CHART_LAYOUT, **layout)
+    fig.update_layout(yaxis2=dict(title='Sentiment / Corr', overlaying='y', side='right', showgrid=False))
+    return fig
+
+def figure_patch(ticker, traces, resolution=None):
+    """Dash partial update that swaps only the trace arrays and title of a figure made by build_figure."""
+    from dash import Patch
+
+    patch = Patch()
+    for key in ('x', 'open', 'high', 'low', 'close'):
+        patch['data'][0][key] = traces[key]
+    patch['data'][1]['x'] = traces['x']
+    patch['data'][1]['y'] = traces['marker_y']
+    patch['data'][1]['marker']['color'] = traces['marker_color']
+    patch['data'][1]['hovertext'] = traces['hovertext']
+    patch['data'][1]['marker']['size'] = traces['marker_size']
+    for i in (0, 1):
+        patch['data'][i]['customdata'] = traces['bounds']
+    for i, key in ((2, 'sentiment_roll'), (3, 'sentiment_return_corr')):
+        patch['data'][i]['x'] = traces['x']
+        patch['data'][i]['y'] = traces[key]
+    patch['layout']['title']['text'] = chart_title(ticker, resolution)
+    return patch
+
+# -----------------------------
+# LRU cache of per-ticker trace arrays
+# -----------------------------
+class FigureCache:
+    """Thread-safe LRU of chart_traces results keyed by (ticker, data version, visible window)."""
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        with self._lock:
+            if key in self._entries:
+                inc("cache_requests_total", cache="figure", result="hit")
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        inc("cache_requests_total", cache="figure", result="miss")
+        value = build()
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
@@ -0,0 +1,31 @@
+import os
+import sys
+import subprocess
+
+# -----------------------------
+# Shared dataset across workers
+# -----------------------------
+# With DASHBOARD_SHARED_DIR set, one publisher process loads the dashboard data and publishes
+# it as memory-mapped Arrow files; every dash_app worker maps the same files instead of
+# querying the storage backend and holding its own copy.
+#
+# The publisher is a separate interpreter (`python dashboard_data.py --forever`), not a thread
+# in the master: workers are forked from the master, and forking while a loader thread holds
+# import/logging locks or live gRPC channels (BigQuery Storage Read API) can hang the child.
+
+_publisher = None
+
+def when_ready(server):
+    global _publisher
+    if os.environ.get("DASHBOARD_SHARED_DIR"):
+        _publisher = subprocess.Popen([sys.executable, "dashboard_data.py", "--forever"],
+                                      cwd=os.path.dirname(os.path.abspath(__file__)))
+        server.log.info("Shared snapshot publisher started (pid %s)", _publisher.pid)
+
+def on_exit(server):
+    if _publisher is not None and _publisher.poll() is None:
+        _publisher.terminate()
+        try:
+            _publisher.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            _publisher.kill()
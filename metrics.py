@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+# -----------------------------
+# Config
+# -----------------------------
+# METRICS_ENABLED=0 turns every timer/counter into a no-op (decorators return the function unchanged)
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+# Batch scripts log one JSON object per line when LOG_FORMAT=json, else a short human-readable line
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+
+# Prometheus default latency buckets (seconds)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# -----------------------------
+# Registry
+# -----------------------------
+class Registry:
+    """In-process counters and latency histograms, keyed by (name, sorted labels)."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}   # key → [bucket counts..., count, sum]
+        self.help = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, labels=()):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, labels=()):
+        key = (name, labels)
+        with self._lock:
+            series = self.histograms.get(key)
+            if series is None:
+                series = self.histograms[key] = [0] * (len(self.buckets) + 2)
+            bucket = bisect_left(self.buckets, seconds)
+            if bucket < len(self.buckets):   # above the last bound → only in +Inf (the count)
+                series[bucket] += 1
+            series[-2] += 1
+            series[-1] += seconds
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def snapshot(self):
+        """Plain dict of every series (used for structured run summaries)."""
+        with self._lock:
+            counters = {_series_name(n, l): v for (n, l), v in self.counters.items()}
+            histograms = {_series_name(n, l): {"count": s[-2], "sum_s": round(s[-1], 6)}
+                          for (n, l), s in self.histograms.items()}
+        return {"counters": counters, "timers": histograms}
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((k, list(v)) for k, v in self.histograms.items())
+
+        lines, typed = [], set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{_series_name(name, labels)} {value}")
+
+        for (name, labels), series in histograms:
+            if name not in typed:
+                typed.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{_series_name(name + '_bucket', labels + (('le', repr(bound)),))} {cumulative}")
+            lines.append(f"{_series_name(name + '_bucket', labels + (('le', '+Inf'),))} {series[-2]}")
+            lines.append(f"{_series_name(name + '_count', labels)} {series[-2]}")
+            lines.append(f"{_series_name(name + '_sum', labels)} {series[-1]}")
+        return "\n".join(lines) + "\n"
+
+def _series_name(name, labels):
+    if not labels:
+        return name
+    pairs = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return f"{name}{{{pairs}}}"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+registry = Registry()
+
+registry.describe("polygon_request_seconds", "Latency of Polygon REST calls")
+registry.describe("polygon_requests_total", "Polygon REST calls by endpoint and HTTP status")
+registry.describe("polygon_retries_total", "Polygon REST calls retried after a 429/5xx or connection error")
+registry.describe("backfill_units_total", "Backfill work units by kind and result (done/failed/skipped)")
+registry.describe("storage_query_seconds", "Latency of storage backend queries")
+registry.describe("storage_load_seconds", "Latency of storage backend loads/upserts")
+registry.describe("storage_read_seconds", "Arrow query reads by phase (download = record batches, decode = to pandas)")
+registry.describe("storage_bytes_processed_total", "Bytes processed by storage backend queries")
+registry.describe("storage_rows_loaded_total", "Rows loaded or upserted into storage")
+registry.describe("preprocess_seconds", "Latency of preprocessing stages")
+registry.describe("dash_callback_seconds", "Latency of Dash callbacks")
+registry.describe("cache_requests_total", "Cache lookups by cache and result (hit/miss)")
+
+# -----------------------------
+# Timers and counters
+# -----------------------------
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+def inc(name, value=1, **labels):
+    if METRICS_ENABLED:
+        registry.inc(name, value, _labels(labels))
+
+def observe(name, seconds, **labels):
+    if METRICS_ENABLED:
+        registry.observe(name, seconds, _labels(labels))
+
+class _NoopTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _NoopTimer()
+
+@contextmanager
+def _timer(name, labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.perf_counter() - start, labels)
+
+def timer(name, **labels):
+    """`with timer("storage_query_seconds", backend="duckdb"): ...` records the block's latency."""
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _timer(name, _labels(labels))
+
+def timed(name, **labels):
+    """Decorator form of timer(); returns the function untouched when metrics are disabled."""
+    def decorate(fn):
+        if not METRICS_ENABLED:
+            return fn
+        key = _labels(labels)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                registry.observe(name, time.perf_counter() - start, key)
+        return wrapper
+    return decorate
+
+def render_prometheus():
+    return registry.render()
+
+# -----------------------------
+# Structured logs (batch scripts)
+# -----------------------------
+logger = logging.getLogger("pipeline")
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        event = {"ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"), "level": record.levelname.lower(),
+                 "event": record.getMessage()}
+        event.update(getattr(record, "fields", {}))
+        return json.dumps(event, default=str)
+
+def configure_logging(fmt=LOG_FORMAT, stream=sys.stderr):
+    """Send `pipeline` events to `stream` as JSON lines (or key=value text); call once from __main__."""
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(_JsonFormatter() if fmt == "json"
+                         else logging.Formatter("%(asctime)s %(levelname)s %(message)s %(fields)s"))
+    logger.handlers[:] = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+def log_event(event, level=logging.INFO, **fields):
+    """One structured event (`event` name + fields); a no-op until configure_logging() is called."""
+    if logger.handlers:
+        logger.log(level, event, extra={"fields": fields})
+
+def log_run_summary(script, started):
+    """Final event of a batch run: wall time plus every counter and timer recorded."""
+    log_event("run_summary", script=script, seconds=round(time.perf_counter() - started, 3), **registry.snapshot())
@@ -0,0 +1,82 @@
+import os
+import math
+
+import numpy as np
+import pandas as pd
+
+# -----------------------------
+# News table: shared paging/sorting/filtering for both dashboards
+# -----------------------------
+PAGE_SIZE = int(os.environ.get("NEWS_PAGE_SIZE", 20))
+
+NEWS_TABLE_COLUMNS = ['ticker', 'title', 'sentiment', 'article_url']
+SENTIMENT_COLORS = {'positive': 'green', 'negative': 'red'}      # everything else → gray
+SENTIMENT_RANK = {'negative': 0, 'neutral': 1, 'positive': 2}     # sort order for the sentiment column
+SORT_COLUMNS = {'link': 'article_url'}                            # DataTable column id → news column
+
+def news_page(day_news, page=0, page_size=PAGE_SIZE, sentiment=None, sort_by=None, ascending=True):
+    """Filter, sort and slice one page of a day's news on the server.
+
+    Returns (page_df, page_count); page_df holds only NEWS_TABLE_COLUMNS plus `color`.
+    `sort_by` is a news column or DataTable column id; anything else leaves the order unchanged.
+    """
+    news = day_news
+    if sentiment:
+        news = news[news['sentiment'].to_numpy() == sentiment]
+
+    sort_by = SORT_COLUMNS.get(sort_by, sort_by)
+    if sort_by == 'sentiment':
+        ranks = news['sentiment'].map(SENTIMENT_RANK).fillna(1).to_numpy()
+        order = np.argsort(ranks if ascending else -ranks, kind='stable')
+        news = news.iloc[order]
+    elif sort_by in news.columns:
+        news = news.sort_values(sort_by, ascending=ascending, kind='stable')
+
+    page_count = max(1, math.ceil(len(news) / page_size))
+    page = min(max(page, 0), page_count - 1)
+    page_df = news.iloc[page * page_size:(page + 1) * page_size][NEWS_TABLE_COLUMNS].copy()
+
+    page_df['article_url'] = page_df['article_url'].fillna('#')
+    page_df['color'] = page_df['sentiment'].map(SENTIMENT_COLORS).fillna('gray')
+    return page_df, page_count
+
+# -----------------------------
+# Dash rendering
+# -----------------------------
+def dash_news_table(table_id, page_size=PAGE_SIZE):
+    """DataTable with custom (server-side) paging and sorting: interactions only resend `data` for one page."""
+    from dash import dash_table
+
+    return dash_table.DataTable(
+        id=table_id,
+        columns=[
+            {'name': 'Ticker', 'id': 'ticker'},
+            {'name': 'Headline', 'id': 'title'},
+            {'name': 'Sentiment', 'id': 'sentiment'},
+            {'name': 'Link', 'id': 'link', 'presentation': 'markdown'},
+        ],
+        data=[],
+        page_action='custom',
+        page_current=0,
+        page_size=page_size,
+        page_count=1,
+        sort_action='custom',
+        sort_mode='single',
+        sort_by=[],
+        markdown_options={'link_target': '_blank'},
+        style_table={'width': '100%'},
+        style_cell={'border': '1px solid black', 'textAlign': 'left', 'whiteSpace': 'normal', 'padding': '4px'},
+        style_data_conditional=[
+            {'if': {'filter_query': f'{{sentiment}} = "{s}"', 'column_id': 'sentiment'}, 'color': c}
+            for s, c in list(SENTIMENT_COLORS.items()) + [('neutral', 'gray')]
+        ],
+    )
+
+def dash_records(page_df):
+    """Column arrays → DataTable rows (the Link column is a markdown link)."""
+    return pd.DataFrame({
+        'ticker': page_df['ticker'].to_numpy(),
+        'title': page_df['title'].to_numpy(),
+        'sentiment': page_df['sentiment'].to_numpy(),
+        'link': ("[Link](" + page_df['article_url'] + ")").to_numpy(),
+    }).to_dict('records')
@@ -0,0 +1,228 @@
+import os
+import gzip
+import json
+import time
+import random
+import hashlib
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import inc, log_event, timer
+
+# -----------------------------
+# Config
+# -----------------------------
+POLYGON_API_KEY = os.environ.get("POLYGON_API_KEY", "s_po7wmfS3zeKBzcL0D2wdkv2H7Z6RSG")  # 🔹 replace for testing
+
+# (connect, read) seconds per request
+TIMEOUT = (float(os.environ.get("POLYGON_CONNECT_TIMEOUT", 5)), float(os.environ.get("POLYGON_READ_TIMEOUT", 30)))
+MAX_RETRIES = int(os.environ.get("POLYGON_MAX_RETRIES", 5))
+BACKOFF_SECONDS = float(os.environ.get("POLYGON_BACKOFF_SECONDS", 1.0))   # first retry delay, doubled per attempt
+BACKOFF_MAX_SECONDS = 60.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Raw responses of closed windows, keyed by request without the API key:
+#   use      read the cache, fetch and store on a miss (default)
+#   refresh  always fetch, overwrite the cache (e.g. after a split changed adjusted bars)
+#   offline  replay from the cache only, a miss is an error (tests, benchmarks, no network)
+#   off      no cache
+CACHE_MODE = os.environ.get("POLYGON_CACHE", "use")
+CACHE_DIR = os.environ.get("POLYGON_CACHE_DIR", os.path.join(".cache", "polygon"))
+
+# -----------------------------
+# HTTP session + rate limiting
+# -----------------------------
+class TokenBucket:
+    """Thread-safe token bucket: `rate_per_minute` tokens refill continuously, bursts up to `capacity`."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return  # unlimited plan
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def make_session(pool_size=1):
+    """One keep-alive session whose connection pool is sized for the worker threads."""
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    return session
+
+def closed_window(end_date):
+    """True if a request ending on `end_date` (YYYY-MM-DD) can no longer change, i.e. the day is over (UTC)."""
+    return end_date is not None and end_date < datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+# -----------------------------
+# Content-addressed response cache
+# -----------------------------
+def canonical_url(url):
+    """`url` without the apiKey parameter and with its query sorted, so equal requests compare equal."""
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() != "apikey")
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+def with_api_key(url, api_key=POLYGON_API_KEY):
+    return f"{url}{'&' if urlsplit(url).query else '?'}apiKey={api_key}"
+
+class ResponseCache:
+    """Raw JSON responses on disk as <dir>/<key[:2]>/<key>.json.gz, key = sha256 of the canonical URL."""
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha256(canonical_url(url).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    def get(self, url):
+        try:
+            with gzip.open(self.path(self.key(url)), "rt", encoding="utf-8") as f:
+                return json.load(f)["response"]
+        except FileNotFoundError:
+            return None
+
+    def put(self, url, payload):
+        path = self.path(self.key(url))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump({"url": canonical_url(url), "fetched_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                       "response": payload}, f)
+        os.replace(tmp_path, path)   # concurrent writers of the same request leave one complete file
+
+class CacheMiss(requests.RequestException):
+    """Offline replay (POLYGON_CACHE=offline) asked for a request that was never cached."""
+
+class PolygonError(requests.RequestException):
+    """Polygon answered with an error body instead of results (403 NOT_AUTHORIZED, 400/404, status ERROR)."""
+
+def error_payload(payload, status):
+    """True unless `payload` has results or is an empty OK answer (e.g. aggregates for a holiday window)."""
+    if "results" in payload:
+        return False
+    return not (status == 200 and payload.get("status") in ("OK", "DELAYED"))
+
+def raise_for_payload(payload, status, url):
+    if error_payload(payload, status):
+        detail = payload.get("error") or payload.get("message") or payload.get("status")
+        raise PolygonError(f"{status} {detail} for {canonical_url(url)}")
+
+# -----------------------------
+# Client: timeouts, retries with backoff, cache
+# -----------------------------
+class PolygonClient:
+    """GET Polygon JSON with timeouts, retries and the on-disk response cache.
+
+    429 and 5xx responses and connection errors are retried up to `max_retries` times,
+    waiting for the Retry-After header if the response has one, else exponential backoff
+    with jitter; then the last error is raised (a requests.RequestException). Cache hits
+    skip the rate limiter. Thread-safe when the session is (one
+    requests.Session shared by the fetch workers).
+    """
+
+    def __init__(self, session=None, rate_limiter=None, cache_mode=None, cache=None,
+                 api_key=POLYGON_API_KEY, timeout=TIMEOUT, max_retries=MAX_RETRIES):
+        self.session = session or requests.Session()
+        self.rate_limiter = rate_limiter
+        self.cache_mode = cache_mode or CACHE_MODE
+        self.cache = cache or ResponseCache()
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.session.close()
+        return False
+
+    def get_json(self, url, endpoint, cacheable=True):
+        """Returns (payload, HTTP status). `url` carries no API key; `cacheable` = the response can no longer change."""
+        use_cache = cacheable and self.cache_mode != "off"
+        if use_cache and self.cache_mode in ("use", "offline"):
+            payload = self.cache.get(url)
+            if payload is not None:
+                inc("cache_requests_total", cache="polygon", result="hit")
+                return payload, 200
+            inc("cache_requests_total", cache="polygon", result="miss")
+        if self.cache_mode == "offline":
+            raise CacheMiss(f"Not in the Polygon cache: {canonical_url(url)}")
+
+        payload, status = self._fetch(url, endpoint)
+        if use_cache and not error_payload(payload, status):
+            self.cache.put(url, payload)
+        return payload, status
+
+    def _fetch(self, url, endpoint):
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                with timer("polygon_request_seconds", endpoint=endpoint):
+                    response = self.session.get(with_api_key(url, self.api_key), timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                inc("polygon_requests_total", endpoint=endpoint, status="error")
+                if attempt == self.max_retries:
+                    raise
+                reason, delay = type(e).__name__, self._backoff(attempt)
+            else:
+                inc("polygon_requests_total", endpoint=endpoint, status=response.status_code)
+                if response.status_code not in RETRY_STATUSES:
+                    return _json(response), response.status_code
+                if attempt == self.max_retries:
+                    # like raise_for_status(), without the API key in the message
+                    raise requests.HTTPError(f"{response.status_code} {response.reason} for {canonical_url(url)}",
+                                             response=response)
+                reason, delay = response.status_code, _retry_after(response) or self._backoff(attempt)
+
+            inc("polygon_retries_total", endpoint=endpoint)
+            log_event("polygon_retry", endpoint=endpoint, attempt=attempt + 1, reason=reason, delay_s=round(delay, 2))
+            print(f"⚠️ Polygon {endpoint} {reason}; retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+    @staticmethod
+    def _backoff(attempt):
+        return min(BACKOFF_MAX_SECONDS, BACKOFF_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+def _retry_after(response):
+    """Seconds to wait from a Retry-After header (delta seconds or HTTP date), None if absent."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return min(BACKOFF_MAX_SECONDS, max(0.0, float(value)))
+    except ValueError:
+        try:
+            wait = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+        return min(BACKOFF_MAX_SECONDS, max(0.0, wait))
+
+def _json(response):
+    try:
+        return response.json()
+    except ValueError:   # e.g. an HTML error page from a proxy
+        return {"status": "ERROR", "error": response.text[:200]}
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+from metrics import timed
+
+# -----------------------------
+# Shared dashboard preprocessing
+# -----------------------------
+# Pandas reference path (news insights → daily sentiment → merged with prices) used by the
+# benchmarks; the dashboards read the server-side views instead and only use NewsStore from here.
+
+SENTIMENT_SCORES = {"positive": 1, "negative": -1}   # anything else (neutral) scores 0
+
+# Article fields the news table shows; everything else in stock_news is dropped in memory
+NEWS_ARTICLE_COLUMNS = ['id', 'title', 'article_url', 'published_utc']
+NEWS_COLUMNS = NEWS_ARTICLE_COLUMNS + ['ticker', 'sentiment', 'date']
+
+class NewsStore:
+    """News insights normalized into two frames, so each article's text is held once.
+
+    articles  one row per article (NEWS_ARTICLE_COLUMNS)
+    insights  one row per (article, insight): `article` (int32 row of `articles`), and
+              `ticker`, `sentiment`, `date` (UTC publish day) as categoricals
+
+    rows() joins the article text onto a slice of insights only when it is displayed.
+    """
+
+    def __init__(self, articles, insights):
+        self.articles = articles
+        self.insights = _compact_insights(insights)
+
+    def __len__(self):
+        return len(self.insights)
+
+    @classmethod
+    def from_rows(cls, news_rows):
+        """From one row per (article, insight) with the article fields repeated (the news_insights view)."""
+        codes, _ = pd.factorize(news_rows['id'])
+        first = np.unique(codes, return_index=True)[1]   # factorize numbers articles in order of appearance
+        articles = news_rows[NEWS_ARTICLE_COLUMNS].iloc[first].reset_index(drop=True)
+        return cls(articles, _insight_frame(articles, codes, news_rows['ticker'], news_rows['sentiment']))
+
+    def sorted(self):
+        """Same store with insights sorted by (ticker, date), so each pair is a contiguous run."""
+        insights = self.insights.sort_values(['ticker', 'date'], kind='stable', ignore_index=True)
+        return NewsStore(self.articles, insights)
+
+    def rows(self, positions=slice(None)):
+        """Insights at `positions` with their article text joined (NEWS_COLUMNS)."""
+        insights = self.insights.iloc[positions]
+        rows = self.articles.take(insights['article'].to_numpy()).reset_index(drop=True)
+        for col in ('ticker', 'sentiment', 'date'):
+            rows[col] = insights[col].to_numpy()
+        return rows
+
+    def memory_usage(self):
+        """Deep in-memory size in bytes (Python string objects included)."""
+        return int(self.articles.memory_usage(deep=True).sum() + self.insights.memory_usage(deep=True).sum())
+
+def _insight_frame(articles, article, ticker, sentiment):
+    # Publish day is parsed once per article, not once per insight
+    days = pd.to_datetime(articles['published_utc'], utc=True).dt.date.to_numpy()
+    article = np.asarray(article, dtype='int32')
+    return pd.DataFrame({
+        'article': article,
+        'ticker': np.asarray(ticker, dtype=object),
+        'sentiment': np.asarray(sentiment, dtype=object),
+        'date': days[article] if len(article) else np.array([], dtype=object),
+    })
+
+def _compact_insights(insights):
+    # Also restores categoricals lost in a Parquet/Arrow round trip
+    return insights.astype({'article': 'int32', 'ticker': 'category', 'sentiment': 'category', 'date': 'category'})
+
+@timed("preprocess_seconds", stage="expand_insights")
+def expand_insights(df_news):
+    """NewsStore with one insight row per (article, insight) that has a ticker and sentiment.
+
+    Only the `insights` column is exploded; article text stays in one row per article.
+    """
+    articles = df_news[NEWS_ARTICLE_COLUMNS].reset_index(drop=True)
+    insights = df_news['insights'].reset_index(drop=True).explode()
+
+    # Pull both fields out column-wise (non-dict rows from empty insight lists → NaN)
+    insights = pd.DataFrame({'ticker': insights.str.get('ticker'), 'sentiment': insights.str.get('sentiment')})
+    insights = insights.dropna(subset=['sentiment', 'ticker'])
+    return NewsStore(articles, _insight_frame(articles, insights.index, insights['ticker'], insights['sentiment']))
+
+@timed("preprocess_seconds", stage="daily_sentiment")
+def compute_daily_sentiment(news):
+    """Per (ticker, date): sentiment_score = #positive - #negative, news_count = #insights.
+
+    `news` is a NewsStore or a frame with one row per insight.
+    """
+    insights = news.insights if isinstance(news, NewsStore) else news
+    score = insights['sentiment'].map(SENTIMENT_SCORES).fillna(0).astype('int64')
+    daily_sentiment = (
+        score.groupby([insights['ticker'], insights['date']], sort=False, observed=True)
+        .agg(['sum', 'size'])
+        .rename(columns={'sum': 'sentiment_score', 'size': 'news_count'})
+        .reset_index()
+    )
+    # Plain key columns, so the join with the price bars matches on values
+    daily_sentiment['ticker'] = daily_sentiment['ticker'].astype(str)
+    daily_sentiment['date'] = daily_sentiment['date'].astype(object)
+    return daily_sentiment
+
+@timed("preprocess_seconds", stage="merge")
+def merge_stock_sentiment(df_stock, daily_sentiment):
+    """Left-join daily sentiment onto the price bars; days without news score 0."""
+    df_stock['ts'] = pd.to_datetime(df_stock['ts'])
+    df_stock['date'] = df_stock['ts'].dt.date
+
+    merged = pd.merge(df_stock, daily_sentiment, left_on=['symbol', 'date'], right_on=['ticker', 'date'], how='left')
+    merged['sentiment_score'] = merged['sentiment_score'].fillna(0).astype('int64')
+    merged['news_count'] = merged['news_count'].fillna(0).astype('int64')
+    return merged
+
+def preprocess(df_stock, df_news):
+    """Pandas reference pipeline used by the benchmarks; returns (merged, NewsStore)."""
+    news = expand_insights(df_news)
+    daily_sentiment = compute_daily_sentiment(news)
+    merged = merge_stock_sentiment(df_stock, daily_sentiment)
+    return merged, news
@@ -0,0 +1,658 @@
+import io
+import os
+import re
+import json
+import threading
+from datetime import date, datetime
+
+import pandas as pd
+import pyarrow as pa
+
+from metrics import inc, timed, timer
+
+# -----------------------------
+# Config
+# -----------------------------
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "bigquery")          # "bigquery" | "duckdb"
+PROJECT_ID = os.environ.get("GCP_PROJECT_ID", "project-portfolio-473015")   # 🔹 replace with your project
+DATASET = os.environ.get("BQ_DATASET", "stock_data_append")
+DUCKDB_PATH = os.environ.get("DUCKDB_PATH", os.path.join(".cache", "stock_data.duckdb"))
+# Arrow reads (query(..., arrow=True)) stream through the BigQuery Storage Read API unless set to 0
+BQ_STORAGE_READ_API = os.environ.get("BQ_STORAGE_READ_API", "1") != "0"
+
+# Column each table is partitioned on (BigQuery) — used to bound MERGE target scans
+PARTITION_COLUMNS = {"stock_daily": "ts", "stock_intraday": "ts", "stock_news": "published_utc", "daily_sentiment": "date"}
+
+# -----------------------------
+# Backend interface
+# -----------------------------
+class StorageBackend:
+    """What the fetchers and dashboards need from the store holding stock_daily / stock_news.
+
+    SQL given to query()/run_query() names tables through table(name) and parameters as
+    @name; each backend translates both to its own dialect.
+    """
+
+    name = None
+    errors = (OSError,)   # exceptions a caller may recover from (e.g. by serving a cached snapshot)
+
+    def table(self, name):
+        """Reference to `name` usable inside a SQL string."""
+        raise NotImplementedError
+
+    def create_dataset(self):
+        pass
+
+    def create_tables(self):
+        """stock_daily, stock_intraday, stock_news, daily_sentiment and the price_sentiment / news_insights views."""
+        raise NotImplementedError
+
+    def load(self, table, data):
+        """Append a DataFrame or Arrow table; returns the number of rows loaded."""
+        raise NotImplementedError
+
+    def upsert(self, table, data, keys):
+        """Insert-or-replace rows on `keys` (duplicate keys inside `data` are collapsed)."""
+        raise NotImplementedError
+
+    def run_query(self, sql, params=None, arrow=False):
+        """Returns (DataFrame, bytes processed).
+
+        With `arrow=True` the result is read as Arrow record batches and the DataFrame keeps
+        Arrow-backed columns (timestamps, strings and nested records in native Arrow types).
+        """
+        raise NotImplementedError
+
+    def query(self, sql, params=None, arrow=False):
+        return self.run_query(sql, params, arrow=arrow)[0]
+
+    def refresh_daily_sentiment(self, since=None, until=None):
+        """Re-aggregate daily_sentiment for every day in [`since`, `until`] (default: all history)."""
+        raise NotImplementedError
+
+    def deduplicate_tables(self):
+        raise NotImplementedError
+
+    def stock_watermarks(self, symbols, table="stock_daily", **filters):
+        """{symbol: max ts in `table`}; symbols without rows are missing.
+
+        `filters` are extra equality conditions, e.g. timespan="minute", multiplier=1 for stock_intraday.
+        """
+        conditions = "".join(f" AND {column} = @{column}" for column in filters)
+        df = self.query(f"""
+            SELECT symbol, MAX(ts) AS max_ts FROM {self.table(table)}
+            WHERE symbol IN UNNEST(@symbols){conditions}
+            GROUP BY symbol
+        """, {"symbols": list(symbols), **filters})
+        return {s: ts.to_pydatetime() for s, ts in zip(df["symbol"], df["max_ts"])}
+
+    def news_watermark(self, symbol):
+        """Max published_utc of articles mentioning `symbol` (None if there are none)."""
+        df = self.query(f"""
+            SELECT MAX(published_utc) AS max_published FROM {self.table('stock_news')}
+            WHERE @symbol IN UNNEST(tickers)
+        """, {"symbol": symbol})
+        value = df["max_published"].iloc[0] if len(df) else None
+        return None if pd.isna(value) else value.to_pydatetime()
+
+    def modified_version(self, tables):
+        """Epoch ms of the latest modification across `tables`, used to version local caches."""
+        raise NotImplementedError
+
+def arrow_frame(table):
+    """pandas view of an Arrow table with ArrowDtype columns (no conversion to object/NumPy dtypes)."""
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+def _num_rows(data):
+    return data.num_rows if isinstance(data, pa.Table) else len(data)
+
+def _column_names(data):
+    return data.column_names if isinstance(data, pa.Table) else list(data.columns)
+
+def _column_range(data, column):
+    """(min, max) of a timestamp column as datetimes, or None if it is empty/all null."""
+    values = pd.Series(data.column(column).to_pandas()) if isinstance(data, pa.Table) else data[column]
+    values = pd.to_datetime(values, utc=True).dropna()
+    if values.empty:
+        return None
+    return values.min().to_pydatetime(), values.max().to_pydatetime()
+
+# -----------------------------
+# BigQuery
+# -----------------------------
+class BigQueryBackend(StorageBackend):
+    name = "bigquery"
+
+    def __init__(self, client=None, project=PROJECT_ID, dataset=DATASET, location="US"):
+        from google.cloud import bigquery
+        from google.api_core.exceptions import GoogleAPIError
+
+        self.bigquery = bigquery
+        self.errors = (GoogleAPIError,)
+        self.client = client or bigquery.Client(project=project)
+        self.project = project
+        self.dataset = dataset
+        self.location = location
+
+    @classmethod
+    def from_env(cls):
+        """Credentials from the GOOGLE_CREDENTIALS JSON env var (Render/Cloud Run), else application defaults."""
+        if "GOOGLE_CREDENTIALS" not in os.environ:
+            return cls()
+
+        from google.cloud import bigquery
+        from google.oauth2 import service_account
+
+        creds_dict = json.loads(os.environ["GOOGLE_CREDENTIALS"])
+        credentials = service_account.Credentials.from_service_account_info(creds_dict)
+        return cls(bigquery.Client(credentials=credentials, project=credentials.project_id))
+
+    def table_id(self, name):
+        return f"{self.project}.{self.dataset}.{name}"
+
+    def table(self, name):
+        return f"`{self.table_id(name)}`"
+
+    def create_dataset(self):
+        from google.api_core.exceptions import Conflict
+
+        dataset_ref = self.bigquery.Dataset(f"{self.project}.{self.dataset}")
+        dataset_ref.location = self.location
+        try:
+            self.client.create_dataset(dataset_ref)
+            print(f"Dataset {self.dataset} created successfully!")
+        except Conflict:
+            print(f"Dataset {self.dataset} already exists.")
+
+    def create_tables(self):
+        from google.api_core.exceptions import Conflict
+        bigquery = self.bigquery
+
+        # --- Table 1: stock_daily ---
+        stock_daily_schema = [
+            bigquery.SchemaField("symbol", "STRING"),
+            bigquery.SchemaField("ts", "TIMESTAMP"),
+            bigquery.SchemaField("open", "FLOAT64"),
+            bigquery.SchemaField("high", "FLOAT64"),
+            bigquery.SchemaField("low", "FLOAT64"),
+            bigquery.SchemaField("close", "FLOAT64"),
+            bigquery.SchemaField("volume", "FLOAT64"),
+            bigquery.SchemaField("vwap", "FLOAT64"),
+            bigquery.SchemaField("trades_count", "INT64")
+        ]
+        stock_daily_table = bigquery.Table(self.table_id("stock_daily"), schema=stock_daily_schema)
+
+        # Partition by ts and cluster by symbol
+        stock_daily_table.time_partitioning = bigquery.TimePartitioning(
+            type_=bigquery.TimePartitioningType.DAY,
+            field="ts"
+        )
+        stock_daily_table.clustering_fields = ["symbol"]
+
+        # --- Table 1b: stock_intraday (minute/hour bars, one row per symbol × bar size × ts) ---
+        stock_intraday_schema = (
+            stock_daily_schema[:1]
+            + [bigquery.SchemaField("timespan", "STRING"), bigquery.SchemaField("multiplier", "INT64")]
+            + stock_daily_schema[1:]
+        )
+        stock_intraday_table = bigquery.Table(self.table_id("stock_intraday"), schema=stock_intraday_schema)
+
+        # Partition by ts (day) and cluster by symbol and bar size
+        stock_intraday_table.time_partitioning = bigquery.TimePartitioning(
+            type_=bigquery.TimePartitioningType.DAY,
+            field="ts"
+        )
+        stock_intraday_table.clustering_fields = ["symbol", "timespan", "multiplier"]
+
+        # --- Table 2: stock_news ---
+        stock_news_schema = [
+            bigquery.SchemaField("id", "STRING"),
+            bigquery.SchemaField("title", "STRING"),
+            bigquery.SchemaField("author", "STRING"),
+            bigquery.SchemaField("description", "STRING"),
+            bigquery.SchemaField("article_url", "STRING"),
+            bigquery.SchemaField("amp_url", "STRING"),
+            bigquery.SchemaField("image_url", "STRING"),
+            bigquery.SchemaField("published_utc", "TIMESTAMP"),
+            bigquery.SchemaField(
+                "publisher", "RECORD",
+                fields=[
+                    bigquery.SchemaField("name", "STRING"),
+                    bigquery.SchemaField("homepage_url", "STRING"),
+                    bigquery.SchemaField("logo_url", "STRING"),
+                    bigquery.SchemaField("favicon_url", "STRING"),
+                ]
+            ),
+            bigquery.SchemaField("tickers", "STRING", mode="REPEATED"),
+            bigquery.SchemaField("keywords", "STRING", mode="REPEATED"),
+            bigquery.SchemaField(
+                "insights", "RECORD", mode="REPEATED",
+                fields=[
+                    bigquery.SchemaField("ticker", "STRING"),
+                    bigquery.SchemaField("sentiment", "STRING"),
+                    bigquery.SchemaField("sentiment_reasoning", "STRING")
+                ]
+            )
+        ]
+        stock_news_table = bigquery.Table(self.table_id("stock_news"), schema=stock_news_schema)
+
+        # Partition by published_utc and cluster by id
+        stock_news_table.time_partitioning = bigquery.TimePartitioning(
+            type_=bigquery.TimePartitioningType.DAY,
+            field="published_utc"
+        )
+        stock_news_table.clustering_fields = ["id"]
+
+        # --- Table 3: daily_sentiment (server-side aggregate of stock_news.insights) ---
+        daily_sentiment_schema = [
+            bigquery.SchemaField("ticker", "STRING"),
+            bigquery.SchemaField("date", "DATE"),
+            bigquery.SchemaField("sentiment_score", "INT64"),
+            bigquery.SchemaField("news_count", "INT64"),
+        ]
+        daily_sentiment_table = bigquery.Table(self.table_id("daily_sentiment"), schema=daily_sentiment_schema)
+
+        # Partition by date and cluster by ticker
+        daily_sentiment_table.time_partitioning = bigquery.TimePartitioning(
+            type_=bigquery.TimePartitioningType.DAY,
+            field="date"
+        )
+        daily_sentiment_table.clustering_fields = ["ticker"]
+
+        # Create tables
+        for table in (stock_daily_table, stock_intraday_table, stock_news_table, daily_sentiment_table):
+            try:
+                self.client.create_table(table)
+                print(f"Table {table.table_id} created successfully!")
+            except Conflict:
+                print(f"Table {table.table_id} already exists.")
+
+        # Prices pre-joined with daily sentiment: what the candlestick chart plots
+        price_sentiment_view = bigquery.Table(self.table_id("price_sentiment"))
+        price_sentiment_view.view_query = f"""
+            SELECT
+                d.symbol, d.ts, d.open, d.high, d.low, d.close, d.volume, d.vwap, d.trades_count,
+                COALESCE(s.sentiment_score, 0) AS sentiment_score,
+                COALESCE(s.news_count, 0) AS news_count
+            FROM {self.table('stock_daily')} d
+            LEFT JOIN {self.table('daily_sentiment')} s
+                ON s.ticker = d.symbol AND s.date = DATE(d.ts)
+        """
+
+        # One row per (article, insight) with only the fields the news table shows
+        news_insights_view = bigquery.Table(self.table_id("news_insights"))
+        news_insights_view.view_query = f"""
+            SELECT n.id, n.title, n.article_url, n.published_utc, i.ticker, i.sentiment
+            FROM {self.table('stock_news')} n, UNNEST(n.insights) AS i
+            WHERE i.ticker IS NOT NULL AND i.sentiment IS NOT NULL
+        """
+
+        for view in (price_sentiment_view, news_insights_view):
+            try:
+                self.client.create_table(view)
+                print(f"View {view.table_id} created successfully!")
+            except Conflict:
+                self.client.update_table(view, ["view_query"])
+                print(f"View {view.table_id} updated.")
+
+    def _load_job(self, data, table_id, write_disposition, schema=None):
+        bigquery = self.bigquery
+        if isinstance(data, pa.Table):
+            # Typed Arrow → Parquet load job, no pandas round-trip
+            import pyarrow.parquet as pq
+
+            buffer = io.BytesIO()
+            pq.write_table(data, buffer)
+            buffer.seek(0)
+            job_config = bigquery.LoadJobConfig(source_format=bigquery.SourceFormat.PARQUET,
+                                                write_disposition=write_disposition)
+            job = self.client.load_table_from_file(buffer, table_id, job_config=job_config)
+        else:
+            job_config = bigquery.LoadJobConfig(schema=schema, write_disposition=write_disposition)
+            job = self.client.load_table_from_dataframe(data, table_id, job_config=job_config)
+        job.result()  # Wait for job to finish
+        return job
+
+    @timed("storage_load_seconds", backend="bigquery", op="load")
+    def load(self, table, data):
+        self._load_job(data, self.table_id(table), self.bigquery.WriteDisposition.WRITE_APPEND)
+        inc("storage_rows_loaded_total", _num_rows(data), backend=self.name, table=table)
+        return _num_rows(data)
+
+    @timed("storage_load_seconds", backend="bigquery", op="upsert")
+    def upsert(self, table, data, keys):
+        from bq_utils import staging_table_id, merge_from_staging
+
+        # Reuse the target schema so nested/REPEATED fields never depend on per-batch type inference
+        staging = staging_table_id(self.table_id(table))
+        schema = None if isinstance(data, pa.Table) else self.client.get_table(self.table_id(table)).schema
+        self._load_job(data, staging, self.bigquery.WriteDisposition.WRITE_TRUNCATE, schema=schema)
+
+        partition_column = PARTITION_COLUMNS.get(table)
+        partition_range = _column_range(data, partition_column) if partition_column else None
+        inc("storage_rows_loaded_total", _num_rows(data), backend=self.name, table=table)
+        return merge_from_staging(self.client, self.table_id(table), staging, keys, _column_names(data),
+                                  partition_column=partition_column, partition_range=partition_range)
+
+    @timed("storage_query_seconds", backend="bigquery", op="query")
+    def run_query(self, sql, params=None, arrow=False):
+        job_config = self.bigquery.QueryJobConfig(query_parameters=[
+            self._parameter(name, value) for name, value in (params or {}).items()
+        ])
+        job = self.client.query(sql, job_config=job_config)
+        if arrow:
+            # Storage Read API: the result table is read as parallel streams of Arrow record
+            # batches (falls back to the paginated REST path if google-cloud-bigquery-storage is missing)
+            rows = job.result()
+            with timer("storage_read_seconds", backend=self.name, phase="download"):
+                table = rows.to_arrow(create_bqstorage_client=BQ_STORAGE_READ_API)
+            with timer("storage_read_seconds", backend=self.name, phase="decode"):
+                df = arrow_frame(table)
+        else:
+            df = job.to_dataframe()
+        inc("storage_bytes_processed_total", job.total_bytes_processed or 0, backend=self.name)
+        return df, job.total_bytes_processed or 0
+
+    def _parameter(self, name, value):
+        bigquery = self.bigquery
+        if isinstance(value, (list, tuple)):
+            element_type = self._parameter_type(value[0]) if value else "STRING"
+            return bigquery.ArrayQueryParameter(name, element_type, list(value))
+        return bigquery.ScalarQueryParameter(name, self._parameter_type(value), value)
+
+    @staticmethod
+    def _parameter_type(value):
+        if isinstance(value, bool):
+            return "BOOL"
+        if isinstance(value, int):
+            return "INT64"
+        if isinstance(value, float):
+            return "FLOAT64"
+        if isinstance(value, datetime):   # before date: datetime is a date subclass
+            return "TIMESTAMP"
+        if isinstance(value, date):
+            return "DATE"
+        return "STRING"
+
+    @timed("storage_query_seconds", backend="bigquery", op="refresh_daily_sentiment")
+    def refresh_daily_sentiment(self, since=None, until=None):
+        query = f"""
+            MERGE {self.table('daily_sentiment')} T
+            USING (
+                SELECT
+                    i.ticker,
+                    DATE(n.published_utc) AS date,
+                    SUM(CASE i.sentiment WHEN 'positive' THEN 1 WHEN 'negative' THEN -1 ELSE 0 END) AS sentiment_score,
+                    COUNT(*) AS news_count
+                FROM {self.table('stock_news')} n, UNNEST(n.insights) AS i
+                WHERE n.published_utc >= TIMESTAMP(@since)
+                  AND n.published_utc < TIMESTAMP(DATE_ADD(@until, INTERVAL 1 DAY))
+                  AND i.ticker IS NOT NULL
+                  AND i.sentiment IS NOT NULL
+                GROUP BY ticker, date
+            ) S
+            ON T.ticker = S.ticker AND T.date = S.date AND T.date BETWEEN @since AND @until
+            WHEN MATCHED THEN UPDATE SET sentiment_score = S.sentiment_score, news_count = S.news_count
+            WHEN NOT MATCHED THEN INSERT (ticker, date, sentiment_score, news_count)
+                VALUES (S.ticker, S.date, S.sentiment_score, S.news_count)
+        """
+        job_config = self.bigquery.QueryJobConfig(query_parameters=[
+            self.bigquery.ScalarQueryParameter("since", "DATE", since or "1970-01-01"),
+            self.bigquery.ScalarQueryParameter("until", "DATE", until or "9999-12-30"),
+        ])
+        job = self.client.query(query, job_config=job_config)
+        job.result()
+        inc("storage_bytes_processed_total", job.total_bytes_processed or 0, backend=self.name)
+        through = f" through {until}" if until else ""
+        print(f"daily_sentiment refreshed since {since or 'the beginning'}{through} ({job.num_dml_affected_rows} rows).")
+
+    def deduplicate_tables(self):
+        statements = {
+            "stock_daily": f"""
+                CREATE OR REPLACE TABLE {self.table('stock_daily')}
+                PARTITION BY TIMESTAMP_TRUNC(ts, DAY)
+                CLUSTER BY symbol AS
+                SELECT * FROM {self.table('stock_daily')}
+                WHERE TRUE
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY symbol, ts) = 1
+            """,
+            "stock_news": f"""
+                CREATE OR REPLACE TABLE {self.table('stock_news')}
+                PARTITION BY TIMESTAMP_TRUNC(published_utc, DAY)
+                CLUSTER BY id AS
+                SELECT * FROM {self.table('stock_news')}
+                WHERE TRUE
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY id) = 1
+            """,
+        }
+        for table, sql in statements.items():
+            self.client.query(sql).result()
+            print(f"Table {table} deduplicated.")
+
+    def modified_version(self, tables):
+        # Metadata calls only, no bytes scanned
+        modified = max(self.client.get_table(self.table_id(t)).modified for t in tables)
+        return int(modified.timestamp() * 1000)
+
+# -----------------------------
+# DuckDB (embedded, local)
+# -----------------------------
+DUCKDB_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS stock_daily (
+        symbol VARCHAR,
+        ts TIMESTAMPTZ,
+        open DOUBLE,
+        high DOUBLE,
+        low DOUBLE,
+        close DOUBLE,
+        volume DOUBLE,
+        vwap DOUBLE,
+        trades_count BIGINT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stock_intraday (
+        symbol VARCHAR,
+        timespan VARCHAR,
+        multiplier BIGINT,
+        ts TIMESTAMPTZ,
+        open DOUBLE,
+        high DOUBLE,
+        low DOUBLE,
+        close DOUBLE,
+        volume DOUBLE,
+        vwap DOUBLE,
+        trades_count BIGINT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stock_news (
+        id VARCHAR,
+        title VARCHAR,
+        author VARCHAR,
+        description VARCHAR,
+        article_url VARCHAR,
+        amp_url VARCHAR,
+        image_url VARCHAR,
+        published_utc TIMESTAMPTZ,
+        publisher STRUCT(name VARCHAR, homepage_url VARCHAR, logo_url VARCHAR, favicon_url VARCHAR),
+        tickers VARCHAR[],
+        keywords VARCHAR[],
+        insights STRUCT(ticker VARCHAR, sentiment VARCHAR, sentiment_reasoning VARCHAR)[]
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_sentiment (
+        ticker VARCHAR,
+        date DATE,
+        sentiment_score BIGINT,
+        news_count BIGINT
+    )
+    """,
+    """
+    CREATE OR REPLACE VIEW price_sentiment AS
+    SELECT
+        d.symbol, d.ts, d.open, d.high, d.low, d.close, d.volume, d.vwap, d.trades_count,
+        COALESCE(s.sentiment_score, 0) AS sentiment_score,
+        COALESCE(s.news_count, 0) AS news_count
+    FROM stock_daily d
+    LEFT JOIN daily_sentiment s
+        ON s.ticker = d.symbol AND s.date = CAST(d.ts AS DATE)
+    """,
+    """
+    CREATE OR REPLACE VIEW news_insights AS
+    SELECT n.id, n.title, n.article_url, n.published_utc, i.ticker, i.sentiment
+    FROM stock_news n, UNNEST(n.insights) AS t(i)
+    WHERE i.ticker IS NOT NULL AND i.sentiment IS NOT NULL
+    """,
+]
+
+class DuckDBBackend(StorageBackend):
+    """Embedded columnar engine with the same tables and views, for local analytics and offline tests.
+
+    A DuckDB file can be opened read-write by one process at a time; use ":memory:" for tests.
+    """
+
+    name = "duckdb"
+
+    def __init__(self, path=DUCKDB_PATH):
+        import duckdb
+
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.errors = (duckdb.Error, OSError)
+        self.conn = duckdb.connect(path)
+        self.conn.execute("SET TimeZone = 'UTC'")
+        self._lock = threading.Lock()   # one writer at a time
+        self._modified_ms = 0
+
+    def table(self, name):
+        return name
+
+    def _cursor(self):
+        # Each cursor is its own connection to the same database, safe to use from another thread
+        return self.conn.cursor()
+
+    def _touch(self):
+        self._modified_ms = int(datetime.now().timestamp() * 1000)
+
+    def create_tables(self):
+        cursor = self._cursor()
+        for ddl in DUCKDB_DDL:
+            cursor.execute(ddl)
+        self._touch()
+        print(f"DuckDB tables ready in {self.path}")
+
+    @timed("storage_load_seconds", backend="duckdb", op="load")
+    def load(self, table, data):
+        with self._lock:
+            cursor = self._cursor()
+            cursor.register("batch", data)
+            cursor.execute(f"INSERT INTO {table} BY NAME SELECT * FROM batch")
+            cursor.unregister("batch")
+            self._touch()
+        inc("storage_rows_loaded_total", _num_rows(data), backend=self.name, table=table)
+        return _num_rows(data)
+
+    @timed("storage_load_seconds", backend="duckdb", op="upsert")
+    def upsert(self, table, data, keys):
+        match = " AND ".join(f"b.{k} = {table}.{k}" for k in keys)
+        partition_keys = ", ".join(keys)
+        with self._lock:
+            cursor = self._cursor()
+            cursor.register("batch", data)
+            cursor.execute("BEGIN TRANSACTION")
+            try:
+                cursor.execute(f"DELETE FROM {table} WHERE EXISTS (SELECT 1 FROM batch b WHERE {match})")
+                cursor.execute(f"""
+                    INSERT INTO {table} BY NAME
+                    SELECT * FROM batch
+                    QUALIFY ROW_NUMBER() OVER (PARTITION BY {partition_keys}) = 1
+                """)
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.unregister("batch")
+            self._touch()
+        inc("storage_rows_loaded_total", _num_rows(data), backend=self.name, table=table)
+        return _num_rows(data)
+
+    @timed("storage_query_seconds", backend="duckdb", op="query")
+    def run_query(self, sql, params=None, arrow=False):
+        sql = re.sub(r"@(\w+)", r"$\1", sql)
+        sql = re.sub(r"(\S+)\s+IN\s+UNNEST\(([^)]+)\)", r"list_contains(\2, \1)", sql, flags=re.IGNORECASE)
+        result = self._cursor().execute(sql, params or {})
+        if not arrow:
+            return result.df(), 0
+        with timer("storage_read_seconds", backend=self.name, phase="download"):
+            table = result.arrow()
+            table = table.read_all() if isinstance(table, pa.RecordBatchReader) else table   # reader in duckdb ≥ 1.4
+        with timer("storage_read_seconds", backend=self.name, phase="decode"):
+            return arrow_frame(table), 0
+
+    @timed("storage_query_seconds", backend="duckdb", op="refresh_daily_sentiment")
+    def refresh_daily_sentiment(self, since=None, until=None):
+        since = since or date(1970, 1, 1)
+        bounds = {"since": since, "until": until or date(9999, 12, 30)}
+        with self._lock:
+            cursor = self._cursor()
+            cursor.execute("BEGIN TRANSACTION")
+            cursor.execute("DELETE FROM daily_sentiment WHERE date BETWEEN $since AND $until", bounds)
+            cursor.execute("""
+                INSERT INTO daily_sentiment
+                SELECT
+                    i.ticker,
+                    CAST(n.published_utc AS DATE) AS date,
+                    SUM(CASE i.sentiment WHEN 'positive' THEN 1 WHEN 'negative' THEN -1 ELSE 0 END) AS sentiment_score,
+                    COUNT(*) AS news_count
+                FROM stock_news n, UNNEST(n.insights) AS t(i)
+                WHERE CAST(n.published_utc AS DATE) BETWEEN $since AND $until
+                  AND i.ticker IS NOT NULL
+                  AND i.sentiment IS NOT NULL
+                GROUP BY ALL
+            """, bounds)
+            cursor.execute("COMMIT")
+            self._touch()
+        print(f"daily_sentiment refreshed since {since}{f' through {until}' if until else ''}.")
+
+    def deduplicate_tables(self):
+        with self._lock:
+            cursor = self._cursor()
+            for table, keys in (("stock_daily", "symbol, ts"), ("stock_news", "id")):
+                cursor.execute(f"""
+                    CREATE OR REPLACE TABLE {table} AS
+                    SELECT * FROM {table}
+                    QUALIFY ROW_NUMBER() OVER (PARTITION BY {keys}) = 1
+                """)
+                print(f"Table {table} deduplicated.")
+            self._touch()
+
+    def modified_version(self, tables):
+        # Writes from this process bump _modified_ms; writes from another process touch the file/WAL
+        mtimes = [os.path.getmtime(p) for p in (self.path, f"{self.path}.wal") if os.path.exists(p)]
+        return max([self._modified_ms] + [int(m * 1000) for m in mtimes])
+
+# -----------------------------
+# Backend factory
+# -----------------------------
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """Process-wide backend chosen by STORAGE_BACKEND (created on first use)."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = DuckDBBackend() if STORAGE_BACKEND == "duckdb" else BigQueryBackend.from_env()
+        return _backend
+
+def set_backend(backend):
+    """Use an explicitly built backend (e.g. a BigQuery client from Streamlit secrets, or DuckDB in tests)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+    return backend